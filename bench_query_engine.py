@@ -0,0 +1,102 @@
+# bench_query_engine.py - Sorgu motoru CPU mikrobenchmark
+"""Model/ChromaDB olmadan sorgu başına CPU maliyetini ölçer
+
+Kullanım:
+    python bench_query_engine.py [tekrar_sayisi] [--baseline=<git revizyonu>]
+
+--baseline verilirse o revizyondaki query_engine.py ayrı modül olarak yüklenir
+ve aynı iş yükü iki sürümde yan yana ölçülür.
+"""
+
+import os
+import sys
+import time
+import json
+import subprocess
+import tempfile
+import importlib.util
+
+from config import get_config
+import query_engine
+
+def load_documents(limit: int = 10) -> list:
+    """Bonus hesabı için örnek dokümanlar"""
+    with open('cpr_egitim_bilgi_bankasi.json', 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return [(dok['icerik'], {'kategori': dok.get('kategori', ''),
+                             'guvenilirlik': dok.get('guvenilirlik', 0.8),
+                             'acillik': dok.get('acillik_seviyesi', 'normal')})
+            for dok in data[:limit]]
+
+def run_query_cpu(query: str, detector, expander, engine, generator, documents) -> None:
+    """Tek sorgunun arama dışı CPU işi - powerful_search ile aynı sıra"""
+    analysis = detector.analyze(query)
+    category = analysis.primary_category
+    variants = (query,) + expander.multi_expand(query, analysis)
+
+    # Her varyant için max_results kadar bonus hesabı (4 x 10 = 40)
+    for variant in variants:
+        for document, metadata in documents:
+            engine._calculate_advanced_bonuses(variant, document, metadata, category)
+
+    generator._split_steps(documents[0][0])
+
+def load_baseline(revision: str):
+    """Verilen git revizyonundaki query_engine.py'yi ayrı modül olarak yükle"""
+    source = subprocess.run(['git', 'show', f"{revision}:query_engine.py"],
+                            capture_output=True, text=True, encoding='utf-8', check=True).stdout
+
+    with tempfile.NamedTemporaryFile('w', suffix='.py', encoding='utf-8', delete=False) as f:
+        f.write(source)
+
+    try:
+        spec = importlib.util.spec_from_file_location('query_engine_baseline', f.name)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.remove(f.name)
+    return module
+
+def measure(module, questions: list, documents: list, repeats: int) -> float:
+    """Modülün sınıflarıyla tüm soruları çalıştır - toplam süre (s)"""
+    detector = module.AdvancedCategoryDetector()
+    expander = module.PowerfulWordExpander()
+    engine = module.PowerfulSearchEngine(collection=None, model=None)
+    generator = module.ResponseGenerator()
+
+    # Isınma
+    for query in questions:
+        run_query_cpu(query, detector, expander, engine, generator, documents)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for query in questions:
+            run_query_cpu(query, detector, expander, engine, generator, documents)
+    return time.perf_counter() - start
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    baseline = next((arg.split('=', 1)[1] for arg in sys.argv[1:] if arg.startswith('--baseline=')), None)
+    repeats = int(args[0]) if args else 200
+
+    documents = load_documents(get_config()['search']['max_results'])
+    questions = get_config()['samples']
+    total_queries = repeats * len(questions)
+
+    versions = [('mevcut', query_engine)]
+    if baseline:
+        versions.insert(0, (f"baseline ({baseline})", load_baseline(baseline)))
+
+    print(f"🧪 {total_queries} sorgu, {len(documents)} doküman/varyant")
+    timings = {}
+    for name, module in versions:
+        elapsed = measure(module, questions, documents, repeats)
+        timings[name] = elapsed
+        print(f"⏱️ {name}: toplam {elapsed:.3f}s, sorgu başına {elapsed / total_queries * 1000:.3f} ms")
+
+    if baseline:
+        base, current = timings[versions[0][0]], timings['mevcut']
+        print(f"⚡ Hızlanma: {base / current:.2f}x")
+
+if __name__ == "__main__":
+    main()
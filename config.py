@@ -1,12 +1,25 @@
 # config.py - v3.0 GELİŞTİRİLMİŞ AYARLAR
 """v3.0 için optimize edilmiş konfigürasyon"""
 
+import os
+import json
+
 # Model ayarları - v3.0 için optimize
 MODEL_CONFIG = {
     'model_name': 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2',  # 🇹🇷 TÜRKÇE OPTİMİZE
     'collection_name': 'cpr_ultra_v3_powerful',  # v3.0 collection
     'max_tokens': 512,
-    'description': '278MB Türkçe optimize + v3.0 Güçlü Arama'
+    'description': '278MB Türkçe optimize + v3.0 Güçlü Arama',
+    'persist_directory': 'chroma_db',  # None: bellek içi ChromaDB (her başlatmada yeniden kurulur)
+    'embed_batch_size': 32,  # Senkronizasyonda batch embedding boyutu
+    'knowledge_base': 'cpr_egitim_bilgi_bankasi.json',  # .json dizi veya .jsonl (satır başına kayıt)
+    'streaming_ingest': True,  # Dosya belleğe alınmadan dokümanlar akış halinde indekslenir
+    'ingest_workers': 0,  # >1 ise doğrulama/hazırlama process pool'da (büyük içe aktarımlar için)
+    'ingest_chunk_size': 500,  # Pool'a gönderilen kayıt parçası boyutu
+    'strict_validation': False,  # True ise tek geçersiz kayıt sistemi başlatmaz
+    'merge_near_duplicates': False,  # Noktalama/büyük harf farkı dışında aynı içerikleri tek dokümana indir
+    'passage_window': 0,  # >0: dokümanlar N adımlık kayan pasajlar halinde indekslenir (1 = adım bazlı)
+    'kb_watch_interval': 0  # Saniye; >0 ise JSON değişince otomatik yeniden yükleme
 }
 
 # UI ayarları - v3.0
@@ -23,9 +36,125 @@ SEARCH_CONFIG = {
     'cache_size': 200,  # Cache artırıldı - güçlü sistem için
     'multi_embedding_enabled': True,  # YENİ: Çoklu embedding aktif
     'advanced_bonuses': True,  # YENİ: Gelişmiş bonus sistemi
-    'fuzzy_matching': True  # YENİ: Fuzzy matching aktif
+    'fuzzy_matching': True,  # YENİ: Fuzzy matching aktif
+    'shared_candidates': True,  # Tek ChromaDB çağrısı + lokal varyant skorlama
+    'candidate_pool_size': 20,  # Ortak havuz için varyant başına k
+    'variant_pruning': True,  # Yeni terim eklemeyen genişletmeler aranmaz
+    'variant_dedup_similarity': 0.995,  # Ortak havuzda bu kosinüsün üstündeki varyant embedding'leri tek arama (0 = kapalı)
+    'variant_weights': {'original': 1.0, 'basic': 0.9, 'smart': 1.1, 'deep': 0.8},  # 0 = varyant aranmaz
+    'bonus_weights': {
+        'exact_match': 0.4,  # Tam eşleşme oranı başına bonus (max %40)
+        'category_same': 1.3,
+        'category_related': 1.1,
+        'reliability': 0.2,  # Güvenilirlik çarpanı 0.8-1.0 arası
+        'length_ideal': 1.15,  # 20-150 kelime
+        'length_near': 1.05,  # 10-20 veya 150-250 kelime
+        'length_other': 0.95,
+        'emergency_kritik': 1.2,
+        'emergency_yuksek': 1.1,
+        'semantic_step': 0.1,  # Ortak yüksek değerli kelime başına
+        'semantic_max': 1.5
+    },
+    'passage_oversample': 3,  # Pasaj modunda k çarpanı - aynı dokümanın pasajları yer kaplar
+    'category_prefilter': False,  # Güvenli kategori tespitinde ChromaDB where filtresi (isteğe bağlı)
+    'prefilter_min_confidence': 0.6,  # Bu güvenin altında global arama
+    'prefilter_min_score': 8,  # Genel kelimeler hariç kategori skoru (en az bir tam kelime eşleşmesi)
+    'prefilter_generic_keywords': ['doz', 'mg', 'oksijen', 'solunum', 'şok', 'küçük'],  # Tek başına filtre açmaz
+    'prefilter_min_results': 3,  # Filtreli arama bundan az doküman dönerse global arama
+    'hybrid_fusion': 'weighted',  # BM25 + dense füzyon: 'weighted', 'rrf' veya None
+    'lexical_weight': 0.3,  # BM25 katkısı (en iyi dense skoruna oranla)
+    'lexical_top_k': 10,  # Füzyona giren BM25 sonuç sayısı
+    'rrf_k': 60,  # Reciprocal rank fusion sabiti
+    'bm25_k1': 1.5,
+    'bm25_b': 0.75,
+    'multi_intent': False,  # Çok parçalı soruları alt sorgulara böl - değerlendirme setinde ölçülene kadar kapalı
+    'multi_intent_min_words': 9,  # Daha kısa sorgular bölünmez
+    'max_sub_queries': 5,
+    'prefetch_enabled': True,  # Hızlı sorular ve örnek sorular arka planda önceden hesaplanır
+    'prefetch_max_entries': 30,  # Cache'te ön hesaplanan kayıt payı - kalanı etkileşimli sorgular için
+    'prefetch_delay': 0.2,  # Ön hesaplamalar arası bekleme (sn) - etkileşimli sorgulara öncelik
+    'live_top_documents': 3,  # Canlı analizde BM25 ile tahmin edilen doküman sayısı (0 = kapalı)
+    'streaming_results': True,  # Orijinal varyantın sonucu önce gösterilir, sonra sıralama iyileşir
+    'rerank': False,  # Son top-N cross-encoder ile yeniden sıralanır (model başlangıçta yüklenir)
+    'rerank_model': 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1',  # Çok dilli küçük cross-encoder
+    'rerank_top_n': 10,  # Yeniden sıralanan sonuç sayısı - kalanı bi-encoder sırasında
+    'rerank_max_length': 512,  # Sorgu + doküman token sınırı
+    'rerank_cache_size': 2048,  # (sorgu, doküman) skor cache'i
+    'early_exit': True,  # Orijinal varyant güvenli eşleşirse diğer varyantlar skorlanmaz (ortak havuzda ek sorgu yok)
+    'early_exit_similarity': 0.85,  # En iyi isabetin gereken en az benzerliği
+    'early_exit_margin': 0.15,  # En iyi ile ikinci isabet arasındaki en az benzerlik farkı
+    'early_exit_shadow_rate': 0.1,  # Erken çıkışların bu oranında tam arama arka planda karşılaştırılır
+    'degradation_enabled': True,  # Yük altında kademeli bozulma (varyant azaltma -> fuzzy yok -> sadece cache)
+    'degradation_queue_depth': [3, 5, 8],  # Seviye 1/2/3 için eşzamanlı arama eşikleri
+    'degradation_p95': [1.5, 3.0, 6.0],  # Seviye 1/2/3 için p95 gecikme eşikleri (sn)
+    'degradation_window_seconds': 60,  # p95 hesabındaki zaman penceresi - yük geçince seviye düşer
+    'degradation_max_samples': 200,  # Pencerede tutulan en fazla gecikme örneği
+    'degradation_min_samples': 10  # p95 için gereken en az örnek
+}
+
+# Üretken yanıt (Ollama uyumlu yerel sunucu) - retrieval sonrası isteğe bağlı aşama
+LLM_CONFIG = {
+    'enabled': True,  # Sunucu başlangıçta erişilemezse otomatik kapanır
+    'base_url': 'http://localhost:11434',
+    'model': 'gemma:2b',
+    'connect_timeout': 3.0,  # Saniye
+    'read_timeout': 30.0,  # Token'lar arası en uzun bekleme (sn)
+    'max_duration': 120.0,  # Tek üretimin toplam süre sınırı (sn)
+    'max_concurrency': 2,  # Aynı anda en fazla üretim
+    'queue_timeout': 5.0,  # Boş slot için bekleme - aşılırsa istek reddedilir
+    'pool_size': 4,  # Keep-alive bağlantı havuzu
+    'temperature': 0.1,
+    'num_predict': 300,
+    'num_ctx': 2048,  # Model bağlam penceresi - bağlam bütçesi = num_ctx - num_predict - şablon/soru
+    'tokenizer': None,  # Bağlam bütçesi için HF tokenizer adı (örn. 'google/gemma-2b'); None: karakter yaklaşımı
+    'chars_per_token': 3.0,  # Tokenizer yokken yaklaşım (Türkçe metin için temkinli)
+    'context_results': 5,  # Paketlemeye aday en iyi sonuç sayısı
+    'context_min_score_ratio': 0.5,  # En iyi skorun bu oranının altındaki sonuçlar bağlama girmez
+    'speculative': True,  # Retrieval yanıtı hemen, LLM iyileştirmesi arka planda (UI yoklar)
+    'refine_poll_interval': 0.25,  # UI yoklama aralığı (sn)
+    'cache_dir': 'generation_cache',  # None: üretim cache'i kapalı
+    'cache_ttl': 7 * 24 * 3600,  # Saniye - protokol değişimi zaten anahtarı değiştirir
+    'cache_max_entries': 500
+}
+
+# Çeviri aşaması (test_ollama.py) - parçalı, eşzamanlı, disk cache'li
+TRANSLATION_CONFIG = {
+    'backend': 'mymemory',  # 'mymemory' veya 'echo' (çevrimdışı yerel yedek)
+    'url': 'https://api.mymemory.translated.net/get',
+    'source': 'en',
+    'target': 'tr',
+    'max_chars': 400,  # MyMemory 500 byte sınırının altında kalsın (Türkçe karakterler 2 byte)
+    'max_workers': 4,  # Eşzamanlı çeviri isteği sınırı
+    'timeout': 15.0,  # Saniye
+    'cache_path': 'translation_cache.json',  # None: disk cache kapalı
+    'cache_max_entries': 5000
+}
+
+# Offline ağırlık ayarlama (tune_search.py) - etiketli sorular önbelleğe alınmış adaylarla yeniden oynatılır
+TUNING_CONFIG = {
+    'labels_path': 'degerlendirme_sorulari.json',  # [{"soru": ..., "beklenen": [doküman id'leri]}]
+    'cache_path': 'tuning_cache.json',  # Adaylar ve bonus girdileri - model/ChromaDB bir kez çalışır
+    'output_path': 'search_weights.json',  # Varsa SEARCH_CONFIG ağırlıklarının yerine geçer
+    'trials': 3000,  # Rastgele arama deneme sayısı (yarısı en iyinin çevresinde)
+    'batch_size': 256,  # Aynı anda NumPy ile değerlendirilen konfigürasyon
+    'seed': 42,
+    'drop_tolerance': 0.0  # Kapatılınca MRR bu kadardan fazla düşmeyen varyant kapatılır
 }
 
+def _load_tuned_weights(path: str):
+    """tune_search.py çıktısı - varyant ağırlıkları ve bonus çarpanlarını günceller"""
+    if not path or not os.path.exists(path):
+        return
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            tuned = json.load(f)
+        SEARCH_CONFIG['variant_weights'].update(tuned.get('variant_weights', {}))
+        SEARCH_CONFIG['bonus_weights'].update(tuned.get('bonus_weights', {}))
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ayarlanmış ağırlıklar okunamadı ({path}): {e}")
+
+_load_tuned_weights(TUNING_CONFIG['output_path'])
+
 # Kategori anahtar kelimeleri - Türkçe odaklı genişletildi
 CATEGORY_KEYWORDS = {
     'cpr': ['cpr', 'kalp masajı', 'kompresyon', 'canlandırma', 'resüsitasyon', 'temel yaşam desteği', 'kardiyopulmoner'],
@@ -35,6 +164,15 @@ CATEGORY_KEYWORDS = {
     'çocuk': ['bebek', 'çocuk', 'pediatrik', 'infant', 'yenidoğan', 'küçük', 'child', 'baby']
 }
 
+# Tespit edilen kategori -> JSON'daki doküman kategorileri (ön filtre için)
+CATEGORY_DOCUMENTS = {
+    'cpr': ['cpr_protokol', 'acls_protokol', 'post_resuscitation', 'kalite_kontrol', 'takim_calisma', 'ozel_durum'],
+    'aed': ['aed_protokol', 'cpr_protokol', 'acls_protokol'],
+    'ilaç': ['ilac_protokol', 'acls_protokol', 'kardiyoloji', 'alerji'],
+    'hava_yolu': ['hava_yolu', 'acls_protokol', 'post_resuscitation'],
+    'çocuk': ['pediatri', 'cpr_protokol', 'acls_protokol']
+}
+
 # Kelime genişletme - Türkçe için optimize
 WORD_MAP = {
     'epinefrin': ['adrenalin', 'vazopresor', 'epinephrine', 'vazopresör'],
@@ -52,6 +190,30 @@ WORD_MAP = {
     'kaç': ['how much', 'how many', 'ne kadar', 'miktar', 'quantity', 'sayı']
 }
 
+# Sidebar hızlı soruları - kategori seçilince arka planda önceden hesaplanır
+QUICK_QUESTIONS = {
+    "🫀 CPR": [
+        "CPR kompresyon oranı nedir?",
+        "Kalp masajı derinliği kaç cm?",
+        "30:2 oranı ne demek?"
+    ],
+    "⚡ AED": [
+        "AED nasıl kullanılır?",
+        "AED elektrot yerleşimi",
+        "AED güvenlik önlemleri"
+    ],
+    "💊 İlaçlar": [
+        "Epinefrin dozu kaç mg?",
+        "Amiodarone ne zaman verilir?",
+        "Atropin endikasyonları"
+    ],
+    "👶 Çocuk": [
+        "Çocuklarda CPR farkları",
+        "Bebek kalp masajı",
+        "Pediatrik dozlar"
+    ]
+}
+
 # Örnek sorular - Türkçe optimize
 SAMPLE_QUESTIONS = [
     "Epinefrin dozu kaç mg ve nasıl uygulanır?",
@@ -91,8 +253,13 @@ def get_config():
         'model': MODEL_CONFIG,
         'ui': UI_CONFIG,
         'search': SEARCH_CONFIG,
+        'llm': LLM_CONFIG,
+        'translation': TRANSLATION_CONFIG,
+        'tuning': TUNING_CONFIG,
         'categories': CATEGORY_KEYWORDS,
+        'category_documents': CATEGORY_DOCUMENTS,
         'word_map': WORD_MAP,
         'samples': SAMPLE_QUESTIONS,
+        'quick_questions': QUICK_QUESTIONS,
         'css': CSS_STYLES
     }
\ No newline at end of file
@@ -1,10 +1,292 @@
 # data_processor.py - Veri işleme
 """CPR JSON verilerini yükler ve hazırlar"""
 
+import os
+import re
 import json
+import math
+import hashlib
 import streamlit as st
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from typing import Iterator, List, Tuple
 from config import get_config
+from query_engine import split_steps
+
+_TOKEN_RE = re.compile(r'\w+')
+
+JSON_LINES_SUFFIXES = ('.jsonl', '.ndjson')
+
+def json_dizi_akisi(dosya, chunk_size: int = 1 << 16) -> Iterator[Tuple[int, dict]]:
+    """Üst seviye JSON dizisini tamamını belleğe almadan eleman eleman çöz - (başladığı satır, eleman)"""
+    decoder = json.JSONDecoder()
+    buffer, pos = '', 0
+    satir, sayilan = 1, 0  # buffer[sayilan] konumunun satırı - satırlar artımlı sayılır
+    eof = False
+    durum = None  # None: '[' bekleniyor, 'bas': ilk eleman/']', 'eleman': ',' sonrası, 'ayrac': ','/']'
+    
+    while True:
+        # Boşlukları atla
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("JSON dizisi kapanmadan dosya bitti")
+            chunk = dosya.read(chunk_size)
+            eof = not chunk
+            satir, sayilan = satir + buffer.count('\n', sayilan, pos), 0
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        
+        karakter = buffer[pos]
+        if durum is None:
+            if karakter != '[':
+                raise ValueError("JSON dizisi bekleniyordu")
+            durum = 'bas'
+            pos += 1
+            continue
+        
+        if durum == 'ayrac':
+            # Elemandan sonra sadece ',' veya ']' gelebilir - [1 2] reddedilir
+            if karakter == ']':
+                return
+            if karakter != ',':
+                raise ValueError(f"JSON dizisinde ',' bekleniyordu: {karakter!r}")
+            durum = 'eleman'
+            pos += 1
+            continue
+        
+        if karakter == ']' and durum == 'bas':
+            return
+        if karakter in ',]':
+            # [1,,2] ve [1,] - ayraçtan sonra eleman yok
+            raise ValueError(f"JSON dizisinde eleman bekleniyordu: {karakter!r}")
+        
+        try:
+            kayit, end = decoder.raw_decode(buffer, pos)
+            # Tampon sonunda biten sayı/literal bir sonraki parçada devam ediyor olabilir
+            if end >= len(buffer) and not eof:
+                raise json.JSONDecodeError("tampon sonu", buffer, end)
+        except json.JSONDecodeError:
+            # Eleman tampon sınırında bölünmüş - bir parça daha oku
+            if eof:
+                raise
+            chunk = dosya.read(chunk_size)
+            eof = not chunk
+            satir, sayilan = satir + buffer.count('\n', sayilan, pos), 0
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        
+        satir, sayilan = satir + buffer.count('\n', sayilan, pos), pos
+        yield satir, kayit
+        pos = end
+        durum = 'ayrac'
+
+def lexical_tokens(text: str) -> List[str]:
+    """Sözcüksel indeks için token'lar - Türkçe İ düzeltmeli"""
+    return _TOKEN_RE.findall(text.replace('İ', 'i').lower())
+
+# Kayıt şeması - alan: (kabul edilen tipler, zorunlu mu)
+KAYIT_SEMASI = {
+    'id': ((str,), False),  # Yoksa içerik hash'inden türetilir
+    'icerik': ((str,), True),
+    'kategori': ((str,), True),
+    'guvenilirlik': ((int, float), False),
+    'acillik_seviyesi': ((str,), False),
+    'metadata': ((dict,), False)
+}
+
+def kayit_dogrula(kayit) -> List[str]:
+    """Kaydı şemaya göre doğrula - hata listesi boşsa kayıt geçerli"""
+    if not isinstance(kayit, dict):
+        return [f"kayıt nesne değil ({type(kayit).__name__})"]
+    
+    hatalar = []
+    for alan, (tipler, zorunlu) in KAYIT_SEMASI.items():
+        if alan not in kayit:
+            if zorunlu:
+                hatalar.append(f"eksik alan: {alan}")
+            continue
+        
+        deger = kayit[alan]
+        if isinstance(deger, bool) or not isinstance(deger, tipler):
+            hatalar.append(f"{alan} tipi hatalı ({type(deger).__name__})")
+    
+    if hatalar:
+        return hatalar
+    
+    if not kayit['icerik'].strip():
+        hatalar.append("icerik boş")
+    
+    if not 0 <= kayit.get('guvenilirlik', 0.8) <= 1:
+        hatalar.append("guvenilirlik 0-1 aralığında değil")
+    
+    # ChromaDB metadata değerleri skaler olmalı
+    if not isinstance(kayit.get('metadata', {}).get('kaynak', ''), str):
+        hatalar.append("metadata.kaynak metin değil")
+    
+    return hatalar
+
+def icerik_hash(embedding_icerik: str, metadata: dict) -> str:
+    """İndekslenen içerik + metadata hash'i (processed_at hariç)"""
+    payload = json.dumps([embedding_icerik, metadata], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def icerik_id(dok: dict) -> str:
+    """id'siz kayıt için deterministik içerik hash id'si"""
+    payload = f"{dok['icerik']} {dok.get('kategori', '')}"
+    return "doc_" + hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+def yakin_kopya_izi(icerik: str) -> str:
+    """Noktalama, boşluk ve büyük/küçük harften bağımsız içerik izi"""
+    return hashlib.sha1(' '.join(lexical_tokens(icerik)).encode('utf-8')).hexdigest()
+
+def dokuman_hazirla_kayit(dok: dict, doc_id: str, processed_at: str) -> dict:
+    """Tek doküman hazırla - saf fonksiyon, process pool'da da çalışır"""
+    # Temel içerik temizleme
+    icerik = dok['icerik']
+    kategori = dok.get('kategori', '')
+    
+    # Embedding için içerik - basit birleştirme
+    embedding_icerik = f"{icerik} {kategori}"
+    
+    # Metadata hazırla
+    metadata = {
+        'kategori': kategori,
+        'guvenilirlik': float(dok.get('guvenilirlik', 0.8)),
+        'acillik': dok.get('acillik_seviyesi', 'normal'),
+        'kaynak': dok.get('metadata', {}).get('kaynak', 'AHA Guidelines')
+    }
+    
+    # İçerik hash'i - artımlı senkronizasyonda değişiklik tespiti
+    metadata['content_hash'] = icerik_hash(embedding_icerik, metadata)
+    metadata['processed_at'] = processed_at
+    
+    return {
+        'id': doc_id,
+        'icerik': icerik,
+        'embedding_icerik': embedding_icerik,
+        'metadata': metadata
+    }
+
+def pasajlara_bol(dok: dict, pencere: int) -> List[dict]:
+    """Hazır dokümanı kayan adım pencerelerine böl - her pasaj ebeveyn id'sini taşır"""
+    adimlar = split_steps(dok['icerik'])
+    pencere = max(1, min(pencere, len(adimlar)))
+    
+    pasajlar = []
+    for bas in range(len(adimlar) - pencere + 1):
+        metin = ' '.join(adimlar[bas:bas + pencere])
+        embedding_icerik = f"{metin} {dok['metadata']['kategori']}"
+        
+        metadata = {k: v for k, v in dok['metadata'].items() if k not in ('content_hash', 'processed_at')}
+        metadata.update({
+            'parent_id': dok['id'],
+            'step_start': bas,
+            'step_end': bas + pencere,
+            'step_count': len(adimlar)
+        })
+        metadata['content_hash'] = icerik_hash(embedding_icerik, metadata)
+        metadata['processed_at'] = dok['metadata']['processed_at']
+        
+        pasajlar.append({
+            'id': f"{dok['id']}#{bas}",
+            'icerik': metin,
+            'embedding_icerik': embedding_icerik,
+            'metadata': metadata
+        })
+    
+    return pasajlar
+
+def _parca_hazirla(parca: List[Tuple[str, dict]], processed_at: str) -> Tuple[List[dict], List[dict]]:
+    """Kayıt parçasını doğrula + hazırla - (dokümanlar, geçersiz kayıtlar)"""
+    dokumanlar, gecersiz = [], []
+    
+    for konum, kayit in parca:
+        hatalar = kayit_dogrula(kayit)
+        if hatalar:
+            kayit_id = kayit.get('id') if isinstance(kayit, dict) else None
+            gecersiz.append({'konum': konum, 'id': kayit_id, 'hatalar': hatalar})
+        else:
+            doc_id = kayit.get('id') or icerik_id(kayit)
+            dokumanlar.append(dokuman_hazirla_kayit(kayit, doc_id, processed_at))
+    
+    return dokumanlar, gecersiz
+
+def _parcalara_bol(kayitlar, boyut: int) -> Iterator[List[Tuple[str, dict]]]:
+    """(satır, kayıt) akışını konum etiketli sabit boyutlu parçalara böl"""
+    parca = []
+    for satir_no, kayit in kayitlar:
+        parca.append((f"satır {satir_no}", kayit))
+        if len(parca) >= boyut:
+            yield parca
+            parca = []
+    if parca:
+        yield parca
+
+def _sirali_paralel(fonksiyon, parcalar, workers: int, *args) -> Iterator:
+    """Parçaları process pool'da işle - sıra korunur, bekleyen iş sayısı sınırlı"""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        bekleyen = deque()
+        for parca in parcalar:
+            bekleyen.append(executor.submit(fonksiyon, parca, *args))
+            # Akışı tüketip belleği doldurmamak için en fazla 2x worker iş kuyrukta
+            if len(bekleyen) >= workers * 2:
+                yield bekleyen.popleft().result()
+        
+        while bekleyen:
+            yield bekleyen.popleft().result()
+
+class BM25Index:
+    """icerik alanı üzerinde ters indeks ile BM25 skorlayıcı"""
+    
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # terim -> {doc_id: tf}
+        self.doc_lengths = {}
+        self.documents = {}  # doc_id -> (icerik, metadata)
+        self.avg_length = 0.0
+        self._total_length = 0
+    
+    def add(self, doc_id: str, icerik: str, metadata: dict = None):
+        """Dokümanı indekse ekle"""
+        tokens = lexical_tokens(icerik)
+        self._total_length += len(tokens) - self.doc_lengths.get(doc_id, 0)
+        self.doc_lengths[doc_id] = len(tokens)
+        self.documents[doc_id] = (icerik, metadata or {})
+        
+        for token in tokens:
+            postings = self.postings.setdefault(token, {})
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+        
+        self.avg_length = self._total_length / len(self.doc_lengths)
+    
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """Sorgu terimlerinin posting listelerinden BM25 skorları"""
+        total_docs = len(self.doc_lengths)
+        if not total_docs:
+            return []
+        
+        scores = {}
+        for term in set(lexical_tokens(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            
+            df = len(postings)
+            idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+            
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+    
+    def __len__(self):
+        return len(self.doc_lengths)
 
 class CPRDataProcessor:
     """CPR veri işleme sınıfı - basitleştirildi"""
@@ -12,13 +294,59 @@ class CPRDataProcessor:
     def __init__(self):
         self.config = get_config()
         self.bilgi_bankasi = []
+        self.kayit_satirlari = []  # bilgi_bankasi kayıtlarının dosyadaki satırları - hata raporu için
+        self.bm25_index = None
+        self.gecersiz_kayitlar = []  # Son geçişteki geçersiz kayıtlar - toplu rapor için
+        self.tekrar_kayitlar = []  # Son geçişte atlanan tekrar id / içerik kayıtları
+        
+    def kayit_akisi(self) -> Iterator[Tuple[int, dict]]:
+        """Ham kayıtları dosyadan tek tek oku - JSON Lines veya JSON dizisi, (satır, kayıt)"""
+        path = self.config['model']['knowledge_base']
         
+        # UTF-8 encoding ile yükle - Türkçe karakter sorunu çözülsün
+        with open(path, 'r', encoding='utf-8') as f:
+            # Yeni dosya geçişi - önceki geçişin hataları geçersiz
+            self.gecersiz_kayitlar = []
+            if path.endswith(JSON_LINES_SUFFIXES):
+                for satir_no, satir in enumerate(f, 1):
+                    if not satir.strip():
+                        continue
+                    try:
+                        yield satir_no, json.loads(satir)
+                    except json.JSONDecodeError as e:
+                        # Bozuk satır tüm içe aktarımı durdurmaz - raporlanır
+                        self.gecersiz_kayitlar.append({
+                            'konum': f"satır {satir_no}", 'id': None,
+                            'hatalar': [f"JSON ayrıştırma hatası: {e.msg}"]
+                        })
+            else:
+                yield from json_dizi_akisi(f)
+    
+    def json_oku(self) -> list:
+        """JSON'u UI mesajı olmadan belleğe oku - arka plan yüklemesi için"""
+        # BM25 indeksi burada değil, senkronizasyondaki ingest geçişinde kurulur
+        konumlu = list(self.kayit_akisi())
+        self.kayit_satirlari = [satir_no for satir_no, _ in konumlu]
+        self.bilgi_bankasi = [kayit for _, kayit in konumlu]
+        return self.bilgi_bankasi
+    
+    def konumlu_kayitlar(self) -> Iterator[Tuple[int, dict]]:
+        """(satır, kayıt) çiftleri - liste yüklü değilse doğrudan dosyadan akar"""
+        if self.bilgi_bankasi:
+            return zip(self.kayit_satirlari, self.bilgi_bankasi)
+        return self.kayit_akisi()
+    
     def json_yukle(self) -> bool:
         """JSON dosyasını UTF-8 ile yükle"""
         try:
-            # UTF-8 encoding ile yükle - Türkçe karakter sorunu çözülsün
-            with open('cpr_egitim_bilgi_bankasi.json', 'r', encoding='utf-8') as f:
-                self.bilgi_bankasi = json.load(f)
+            if self.config['model']['streaming_ingest']:
+                # Akış modu - dokümanlar indekslenirken dosyadan okunur
+                if not os.path.exists(self.config['model']['knowledge_base']):
+                    raise FileNotFoundError(self.config['model']['knowledge_base'])
+                st.success("✅ Bilgi bankası akış modunda okunacak")
+                return True
+            
+            self.json_oku()
             
             st.success(f"✅ {len(self.bilgi_bankasi)} doküman yüklendi")
             return True
@@ -30,55 +358,103 @@ class CPRDataProcessor:
             st.error(f"❌ Yükleme hatası: {str(e)}")
             return False
     
-    def dokuman_hazirla(self, dok: dict) -> dict:
-        """Tek doküman hazırla - embedding için"""
-        # Temel içerik temizleme
-        icerik = dok['icerik']
-        kategori = dok.get('kategori', '')
-        
-        # Embedding için içerik - basit birleştirme
-        embedding_icerik = f"{icerik} {kategori}"
-        
-        # Metadata hazırla
-        metadata = {
-            'kategori': kategori,
-            'guvenilirlik': float(dok.get('guvenilirlik', 0.8)),
-            'acillik': dok.get('acillik_seviyesi', 'normal'),
-            'kaynak': dok.get('metadata', {}).get('kaynak', 'AHA Guidelines'),
-            'processed_at': datetime.now().isoformat()
-        }
-        
-        return {
-            'id': dok.get('id', f"doc_{len(self.bilgi_bankasi)}"),
-            'icerik': icerik,
-            'embedding_icerik': embedding_icerik,
-            'metadata': metadata
-        }
-    
-    def batch_hazirla(self) -> list:
-        """Tüm dokümanları hazırla"""
-        hazir_dokumanlar = []
+    def dokuman_akisi(self) -> Iterator[dict]:
+        """Ayrıştır -> doğrula -> hazırla hattı - geçerli dokümanları tek tek üret"""
+        # BM25 indeksi akış sırasında kurulur, geçersizler gecersiz_kayitlar'a eklenir
+        # (liste dosya okunurken sıfırlanır - json_oku'nun ayrıştırma hataları korunur)
+        search_config = self.config['search']
+        model_config = self.config['model']
+        index = BM25Index(search_config['bm25_k1'], search_config['bm25_b'])
+        self.tekrar_kayitlar = []
+        processed_at = datetime.now().isoformat()  # Tüm geçiş için tek zaman damgası
+        
+        # Tek geçişte tekrar tespiti - id ve içerik hash kümeleri
+        gorulen_idler = set()
+        gorulen_icerikler = {}  # content_hash / yakın kopya izi -> ilk id
+        yakin_kopya = model_config['merge_near_duplicates']
+        
+        # Liste yüklü değilse doğrudan dosyadan akıt
+        parcalar = _parcalara_bol(self.konumlu_kayitlar(), model_config['ingest_chunk_size'])
         
-        for dok in self.bilgi_bankasi:
-            hazir_dok = self.dokuman_hazirla(dok)
-            hazir_dokumanlar.append(hazir_dok)
+        workers = model_config['ingest_workers']
+        if workers > 1:
+            sonuclar = _sirali_paralel(_parca_hazirla, parcalar, workers, processed_at)
+        else:
+            sonuclar = (_parca_hazirla(parca, processed_at) for parca in parcalar)
         
-        return hazir_dokumanlar
+        for dokumanlar, gecersiz in sonuclar:
+            self.gecersiz_kayitlar.extend(gecersiz)
+            for dok in dokumanlar:
+                if dok['id'] in gorulen_idler:
+                    self.tekrar_kayitlar.append({'id': dok['id'], 'neden': 'tekrarlanan id'})
+                    continue
+                
+                iz = yakin_kopya_izi(dok['icerik']) if yakin_kopya else dok['metadata']['content_hash']
+                if iz in gorulen_icerikler:
+                    self.tekrar_kayitlar.append({'id': dok['id'], 'neden': f"{gorulen_icerikler[iz]} ile aynı içerik"})
+                    continue
+                
+                gorulen_idler.add(dok['id'])
+                gorulen_icerikler[iz] = dok['id']
+                index.add(dok['id'], dok['icerik'], dok['metadata'])
+                yield dok
+        
+        # İndeks sadece akış tamamlanınca devreye girer
+        self.bm25_index = index
+    
+    def indeks_akisi(self) -> Iterator[dict]:
+        """Vektör indeksine girecek birimler - doküman veya adım pasajları"""
+        pencere = self.config['model']['passage_window']
+        
+        for dok in self.dokuman_akisi():
+            if pencere:
+                yield from pasajlara_bol(dok, pencere)
+            else:
+                yield dok
     
     def validate_data(self) -> bool:
-        """Veri doğrulama - basit kontrol"""
-        if not self.bilgi_bankasi:
+        """İndeksleme öncesi kontrol - kayıt hataları ingest geçişinde toplanır, sonra toplu raporlanır"""
+        # Akış modunda ayrı doğrulama geçişi yok - strict mod indekse dokunmadan karar vermeli
+        if not self.bilgi_bankasi and not self.config['model']['strict_validation']:
+            st.info("🔎 Kayıtlar indeksleme sırasında doğrulanacak")
+            return True
+        
+        # Bellekteki liste veya strict akış modunda dosya - sadece karar, rapor ingest geçişinden
+        gecerli = 0
+        hatali = []
+        for satir_no, kayit in self.konumlu_kayitlar():
+            hatalar = kayit_dogrula(kayit)
+            if hatalar:
+                kayit_id = kayit.get('id') if isinstance(kayit, dict) else None
+                hatali.append({'konum': f"satır {satir_no}", 'id': kayit_id, 'hatalar': hatalar})
+            else:
+                gecerli += 1
+        
+        if not gecerli:
             st.error("❌ Veri yok!")
-            return False
+        elif self.config['model']['strict_validation'] and (hatali or self.gecersiz_kayitlar):
+            st.error("❌ Geçersiz kayıt var (strict_validation)")
+        else:
+            st.success(f"✅ Veri geçerli! ({gecerli} kayıt)")
+            return True
         
-        # İlk dokümanı kontrol et
-        first_doc = self.bilgi_bankasi[0]
-        required_fields = ['id', 'icerik', 'kategori']
+        # Başlatma durur - ingest geçişi olmayacağı için hatalar burada gösterilir
+        self.gecersiz_kayitlar = self.gecersiz_kayitlar + hatali
+        self.gecersiz_rapor()
+        return False
+    
+    def gecersiz_rapor(self, limit: int = 20):
+        """Geçersiz ve tekrar kayıtları tek seferde göster"""
+        if self.tekrar_kayitlar:
+            st.info(f"♻️ {len(self.tekrar_kayitlar)} tekrar kayıt birleştirildi: "
+                    + ", ".join(f"{kayit['id']} ({kayit['neden']})" for kayit in self.tekrar_kayitlar[:limit]))
         
-        for field in required_fields:
-            if field not in first_doc:
-                st.error(f"❌ Eksik alan: {field}")
-                return False
+        if not self.gecersiz_kayitlar:
+            return
         
-        st.success("✅ Veri geçerli!")
-        return True
\ No newline at end of file
+        st.warning(f"⚠️ {len(self.gecersiz_kayitlar)} geçersiz kayıt atlanacak")
+        with st.expander("📋 Geçersiz kayıtlar", expanded=False):
+            for kayit in self.gecersiz_kayitlar[:limit]:
+                st.write(f"• {kayit['konum']} ({kayit['id'] or 'id yok'}): {', '.join(kayit['hatalar'])}")
+            if len(self.gecersiz_kayitlar) > limit:
+                st.write(f"... ve {len(self.gecersiz_kayitlar) - limit} kayıt daha")
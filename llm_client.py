@@ -0,0 +1,308 @@
+# llm_client.py - Ollama üretim istemcisi
+"""Havuzlu, akışlı Ollama istemcisi - retrieval sonuçları üzerine yanıt üretimi"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from typing import List, Dict, Iterator, Tuple
+from config import get_config
+from query_engine import split_steps
+
+# HTTP istemcisi - yoksa üretim aşaması devre dışı
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    REQUESTS_OK = True
+except ImportError:
+    REQUESTS_OK = False
+
+# Bağlam paketleme için model tokenizer'ı - yoksa karakter yaklaşımı
+try:
+    from transformers import AutoTokenizer
+    TOKENIZER_OK = True
+except ImportError:
+    TOKENIZER_OK = False
+
+_STEP_PREFIX_RE = re.compile(r'^adım\s*:\s*', re.I)
+
+PROMPT_TEMPLATE = """Sen bir acil tıp eğitmenisin. Sadece aşağıdaki protokol bilgilerini kullanarak soruyu kısa ve net Türkçe yanıtla.
+Bilgi protokollerde yoksa bunu açıkça söyle.
+
+### Protokoller
+{context}
+
+### Soru
+{question}
+
+### Yanıt
+"""
+
+def build_prompt(question: str, context: str) -> str:
+    """Paketlenmiş bağlam + soru"""
+    return PROMPT_TEMPLATE.format(context=context, question=question)
+
+class ContextBuilder:
+    """Retrieval sonuçlarını token bütçesine paketle - tekrar eden adımlar atılır, düşük skorlu kuyruk kırpılır"""
+    
+    def __init__(self):
+        self.config = get_config()['llm']
+        self.tokenizer = self._load_tokenizer(self.config.get('tokenizer'))
+    
+    def count_tokens(self, text: str) -> int:
+        """Model tokenizer'ı ile, yoksa karakter/token oranıyla"""
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        return int(len(text) / self.config['chars_per_token']) + 1
+    
+    def context_budget(self, question: str) -> int:
+        """num_ctx - üretim payı - şablon ve soru"""
+        overhead = self.count_tokens(build_prompt(question, ""))
+        return self.config['num_ctx'] - self.config['num_predict'] - overhead
+    
+    def build_prompt(self, question: str, results: List[Dict]) -> Tuple[str, Dict]:
+        """Bütçeye sığan prompt ve paketleme istatistikleri"""
+        context, stats = self.pack(results, self.context_budget(question))
+        return build_prompt(question, context), stats
+    
+    def pack(self, results: List[Dict], budget: int) -> Tuple[str, Dict]:
+        """Geldiği sıradaki dokümanlardan adım adım bağlam - bütçe dolunca kalan kuyruk atılır"""
+        stats = {'documents': 0, 'steps': 0, 'duplicate_steps': 0, 'trimmed_steps': 0,
+                 'trimmed_documents': 0, 'tokens': 0, 'budget': budget}
+        
+        # Sıra arama motorunundur (cross-encoder sırası dahil) - skor sadece alt eşik için
+        min_score = max((r['skor'] for r in results), default=0.0) * self.config['context_min_score_ratio']
+        
+        seen_steps = set()
+        blocks = []
+        used = 0
+        for result in results:
+            if result['skor'] < min_score or used >= budget:
+                stats['trimmed_documents'] += 1
+                continue
+            
+            header = f"[{len(blocks) + 1}] ({result['kategori'].replace('_', ' ')})"
+            block_tokens = self.count_tokens(header)
+            lines = []
+            steps = split_steps(result['icerik'])
+            for i, step in enumerate(steps):
+                step = _STEP_PREFIX_RE.sub('', step)
+                
+                # Örtüşen pasaj/protokollerde aynı adım bir kez
+                key = ' '.join(step.lower().split())
+                if key in seen_steps:
+                    stats['duplicate_steps'] += 1
+                    continue
+                
+                line = f"- {step}"
+                line_tokens = self.count_tokens(line)
+                if used + block_tokens + line_tokens > budget:
+                    stats['trimmed_steps'] += len(steps) - i
+                    break
+                
+                seen_steps.add(key)
+                lines.append(line)
+                block_tokens += line_tokens
+            
+            if not lines:
+                stats['trimmed_documents'] += 1
+                continue
+            
+            blocks.append(header + "\n" + "\n".join(lines))
+            used += block_tokens
+            stats['documents'] += 1
+            stats['steps'] += len(lines)
+        
+        stats['tokens'] = used
+        return "\n\n".join(blocks), stats
+    
+    def _load_tokenizer(self, name: str):
+        """HF tokenizer - isim yoksa veya yüklenemezse None"""
+        if not name or not TOKENIZER_OK:
+            return None
+        try:
+            return AutoTokenizer.from_pretrained(name)
+        except Exception as e:
+            print(f"⚠️ Tokenizer yüklenemedi ({name}): {e} - karakter yaklaşımı kullanılıyor")
+            return None
+
+def generation_key(question: str, results: List[Dict], model: str, options: Dict) -> str:
+    """Normalize soru + bağlam dokümanları (id, içerik hash) + model + seçenekler parmak izi"""
+    normalized = ' '.join(question.lower().split())
+    documents = [(r['id'], hashlib.sha1(r['icerik'].encode('utf-8')).hexdigest()) for r in results]
+    raw = json.dumps([normalized, documents, model, options], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+class GenerationCache:
+    """Diskte üretim cache'i - kayıt başına dosya, TTL ve kayıt sayısı sınırı"""
+    
+    def __init__(self, cache_dir: str, ttl: float, max_entries: int):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def get(self, key: str) -> str:
+        """Geçerli kayıt - yoksa, bozuksa veya süresi dolduysa None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            created, text = entry['created'], entry['text']
+            # Elle düzenlenmiş/bozuk kayıt - bool da int sayıldığı için ayrıca elenir
+            if isinstance(created, bool) or not isinstance(created, (int, float)) or not isinstance(text, str):
+                raise ValueError("geçersiz cache kaydı")
+            expired = time.time() - created > self.ttl
+        except (OSError, ValueError, KeyError, TypeError):
+            # JSONDecodeError / UnicodeDecodeError da ValueError
+            self.stats['misses'] += 1
+            return None
+        
+        if expired:
+            self.stats['expired'] += 1
+            self._remove(path)
+            return None
+        
+        self.stats['hits'] += 1
+        try:
+            os.utime(path)  # Son kullanım - tahliye sırası için
+        except OSError:
+            pass  # Eşzamanlı tahliye ile yarış - metin zaten okundu
+        return text
+    
+    def put(self, key: str, text: str, model: str):
+        """Atomik yazım, ardından sınır aşılırsa en eski kullanılanlar silinir - disk hatası üretimi bozmaz"""
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'created': time.time(), 'model': model, 'text': text}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Üretim cache'ine yazılamadı: {e}")
+            self._remove(tmp_path)
+            return
+        
+        with self._lock:
+            try:
+                entries = [(entry.stat().st_mtime, entry.path) for entry in os.scandir(self.cache_dir)
+                           if entry.name.endswith('.json')]
+            except OSError as e:
+                print(f"⚠️ Üretim cache'i taranamadı: {e}")
+                return
+            
+            overflow = len(entries) - self.max_entries
+            if overflow > 0:
+                entries.sort()
+                for _, entry_path in entries[:overflow]:
+                    self._remove(entry_path)
+                    self.stats['evicted'] += 1
+    
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.cache_dir) if name.endswith('.json'))
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+    
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+class OllamaClient:
+    """Keep-alive bağlantı havuzu, akışlı token çıkışı, zaman aşımı ve eşzamanlılık sınırı"""
+    
+    def __init__(self, base_url: str = None, model: str = None):
+        self.config = get_config()['llm']
+        self.base_url = (base_url or self.config['base_url']).rstrip('/')
+        self.model = model or self.config['model']
+        
+        # Tüm istekler aynı oturum - TCP bağlantıları yeniden kullanılır
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.config['pool_size'])
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        # Aynı anda en fazla max_concurrency üretim - yerel model paylaşılır
+        self._slots = threading.BoundedSemaphore(self.config['max_concurrency'])
+        
+        self.stats = {'requests': 0, 'tokens': 0, 'errors': 0, 'rejected': 0}
+    
+    def is_available(self) -> bool:
+        """Sunucu erişilebilir mi (kısa zaman aşımı)"""
+        try:
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=self.config['connect_timeout'])
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+    
+    def generation_options(self, options: Dict = None) -> Dict:
+        """İsteğe giden üretim seçenekleri"""
+        return {
+            "temperature": self.config['temperature'],
+            "num_predict": self.config['num_predict'],
+            "num_ctx": self.config['num_ctx'],
+            **(options or {})
+        }
+    
+    def generate_stream(self, prompt: str, model: str = None, options: Dict = None,
+                        timeout: float = None, status: Dict = None) -> Iterator[str]:
+        """Token'ları geldikçe üret - hata/meşguliyet/zaman aşımında akış biter, tamamlanınca status['done']"""
+        if not self._slots.acquire(timeout=self.config['queue_timeout']):
+            self.stats['rejected'] += 1
+            print("⏳ LLM MEŞGUL - istek reddedildi")
+            return
+        
+        try:
+            payload = {
+                "model": model or self.model,
+                "prompt": prompt,
+                "stream": True,
+                "options": self.generation_options(options)
+            }
+            
+            # read timeout token'lar arası bekleme, max_duration toplam süre sınırı
+            read_timeout = timeout or self.config['read_timeout']
+            deadline = time.monotonic() + self.config['max_duration']
+            self.stats['requests'] += 1
+            
+            with self.session.post(f"{self.base_url}/api/generate", json=payload, stream=True,
+                                   timeout=(self.config['connect_timeout'], read_timeout)) as response:
+                response.raise_for_status()
+                
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        raise RuntimeError(chunk['error'])
+                    
+                    token = chunk.get('response', '')
+                    if token:
+                        self.stats['tokens'] += 1
+                        yield token
+                    
+                    if chunk.get('done') and status is not None:
+                        status['done'] = True
+                    
+                    # 'done' sonrası akış sunucu tarafından kapanır - bağlantı havuza temiz döner
+                    if not chunk.get('done') and time.monotonic() > deadline:
+                        print("⏱️ LLM SÜRE SINIRI - yanıt kesildi")
+                        break
+        
+        except Exception as e:
+            self.stats['errors'] += 1
+            print(f"🚨 LLM HATASI: {str(e)}")
+        
+        finally:
+            self._slots.release()
+    
+    def generate(self, prompt: str, model: str = None, options: Dict = None, timeout: float = None) -> str:
+        """Tam yanıt - akışın birleşimi"""
+        return "".join(self.generate_stream(prompt, model, options, timeout))
@@ -26,6 +26,7 @@ def check_files():
         'data_processor.py',
         'query_engine.py', 
         'model_core.py',
+        'llm_client.py',
         'ui_main.py',
         'cpr_egitim_bilgi_bankasi.json'
     ]
@@ -1,16 +1,21 @@
 # model_core.py - v3.0 SYNTAX HATASI DÜZELTİLDİ
 """Temiz ve çalışan v3.0 sistemi"""
 
+import os
 import time
 import re
+import threading
+import weakref
+from collections import deque
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Tuple, Iterator
 import streamlit as st
 
 # Imports
 from config import get_config
 from data_processor import CPRDataProcessor  
-from query_engine import PowerfulSearchEngine, ResponseGenerator
+from llm_client import OllamaClient, GenerationCache, ContextBuilder, generation_key, REQUESTS_OK
+from query_engine import PowerfulSearchEngine, ResponseGenerator, DEGRADATION_LEVELS
 
 # Dependencies
 try:
@@ -26,9 +31,189 @@ try:
 except ImportError:
     TRANSFORMERS_OK = False
 
+# Yeniden sıralama için - yoksa aşama kapalı
+try:
+    from sentence_transformers import CrossEncoder
+    CROSS_ENCODER_OK = True
+except ImportError:
+    CROSS_ENCODER_OK = False
+
+def _batched(iterable, size: int):
+    """Akıştan sabit boyutlu listeler üret"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class SharedIndex:
+    """Süreç genelinde tek aktif indeks - tüm oturumlar aynı nesli, yeniden yüklemeyi ve izleyiciyi paylaşır"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()  # ilk kurulum ve yeniden yükleme süreçte tek seferde
+        self.client = None
+        self.current = (0, None, None)  # (nesil, koleksiyon, veri işlemci) - atomik okunur
+        self.mtime = None
+        self.last_reload = None
+        self.watcher = None
+        
+        # Koleksiyon adı -> canlı motor sayısı; emekli nesiller referans bitince silinir
+        self._refs = {}
+        self._retired = set()
+        self._refs_lock = threading.Lock()
+    
+    @staticmethod
+    def _generation_suffix(name: str, base_name: str):
+        """'<base>_<ms>' nesil adının sayısal soneki - nesil koleksiyonu değilse None"""
+        if name == base_name:
+            return 0
+        suffix = name[len(base_name) + 1:] if name.startswith(base_name + '_') else ''
+        return int(suffix) if suffix.isdigit() else None
+    
+    def open_active(self, client, base_name: str):
+        """Açılışta en yeni nesli aç - yarım kalan/eski nesiller silinir"""
+        self.client = client
+        generations = []
+        for collection in client.list_collections():
+            name = getattr(collection, 'name', collection)  # eski sürümler ad döndürür
+            suffix = self._generation_suffix(name, base_name)
+            if suffix is not None:
+                generations.append((suffix, name))
+        generations.sort()
+        
+        active = generations[-1][1] if generations else base_name
+        for _, name in generations[:-1]:
+            self._drop(name)
+        
+        return client.get_or_create_collection(name=active, metadata={"version": "v3_powerful"})
+    
+    def new_collection(self, base_name: str):
+        """Yeniden yükleme için benzersiz adlı boş nesil koleksiyonu"""
+        name = f"{base_name}_{int(time.time() * 1000)}"
+        return self.client.get_or_create_collection(name=name, metadata={"version": "v3_powerful"})
+    
+    def publish(self, collection, data_processor, mtime):
+        """Yeni nesli aktif yap - önceki koleksiyon emekli olur (lock tutulurken çağrılır)"""
+        generation, previous, _ = self.current
+        self.current = (generation + 1, collection, data_processor)
+        self.mtime = mtime
+        
+        if previous is not None and previous.name != collection.name:
+            self.retire(previous.name)
+    
+    def retire(self, name: str):
+        """Koleksiyonu emekli et - onu kullanan motor kalmadıysa hemen sil"""
+        with self._refs_lock:
+            self._retired.add(name)
+            unused = not self._refs.get(name)
+        if unused:
+            self._drop(name)
+    
+    def track(self, engine):
+        """Motorun koleksiyonunu referansla - motor çöpe gidince referans düşer"""
+        name = engine.collection.name
+        with self._refs_lock:
+            self._refs[name] = self._refs.get(name, 0) + 1
+        weakref.finalize(engine, self._release, name)
+    
+    def _release(self, name: str):
+        """Motor çöpe gitti - emekli koleksiyonun son kullanıcısıysa sil"""
+        with self._refs_lock:
+            self._refs[name] -= 1
+            unused = not self._refs[name] and name in self._retired
+        if unused:
+            self._drop(name)
+    
+    def _drop(self, name: str):
+        """Koleksiyonu sil - devam eden sorgu kalmadığı için güvenli"""
+        with self._refs_lock:
+            self._retired.discard(name)
+            self._refs.pop(name, None)
+        try:
+            self.client.delete_collection(name)
+            print(f"🗑️ Eski indeks nesli silindi: {name}")
+        except Exception as e:
+            print(f"⚠️ İndeks nesli silinemedi ({name}): {e}")
+
+# Streamlit her oturuma ayrı CPRModelCore verir - indeks durumu süreçte tektir
+_SHARED_INDEX = SharedIndex()
+
+class PrefetchQueue:
+    """Süreç genelinde tek ön hesaplama kuyruğu - tüm oturumların etkileşimli sorgularına yol verir"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = deque()  # (oturum çekirdeği, soru)
+        self.pending = set()  # (id(çekirdek), normalize soru)
+        self.worker = None
+        self.active_queries = 0  # Tüm oturumlardaki etkileşimli sorgular
+    
+    def add(self, core, questions: List[str]) -> int:
+        """Soruları kuyruğa ekle - gerekirse tek worker thread'i başlat (lock tutulurken çağrılır)"""
+        added = 0
+        for question in questions:
+            key = question.strip().lower()
+            if key in core.response_cache or (id(core), key) in self.pending:
+                continue
+            self.pending.add((id(core), key))
+            self.queue.append((core, question))
+            added += 1
+        
+        if added and self.worker is None:
+            self.worker = threading.Thread(target=self._run, args=(core.config['search']['prefetch_delay'],),
+                                           daemon=True)
+            self.worker.start()
+        return added
+    
+    def _run(self, delay: float):
+        """Kuyruğu boşalt - herhangi bir oturumda etkileşimli sorgu varken bekler"""
+        try:
+            while True:
+                with self.lock:
+                    if not self.queue:
+                        self.worker = None
+                        return
+                    core, question = self.queue.popleft()
+                
+                # Etkileşimli sorgulara yol ver
+                time.sleep(delay)
+                while self.active_queries:
+                    time.sleep(delay)
+                
+                try:
+                    core._prefetch_one(question)
+                except Exception as e:
+                    # Tek sorunun hatası kuyruğu durdurmaz
+                    print(f"🚨 ÖN HESAPLAMA HATASI ({question[:40]}): {str(e)}")
+                finally:
+                    with self.lock:
+                        self.pending.discard((id(core), question.strip().lower()))
+        finally:
+            # Beklenmeyen çıkışta da sonraki add() yeni worker başlatabilsin
+            with self.lock:
+                if self.worker is threading.current_thread():
+                    self.worker = None
+    
+    def begin_query(self):
+        with self.lock:
+            self.active_queries += 1
+    
+    def end_query(self):
+        with self.lock:
+            self.active_queries -= 1
+
+_PREFETCH = PrefetchQueue()
+
 class CPRModelCore:
     """Ana CPR sistem - v3.0"""
     
+    RESPONSE_CACHE_LIMIT = 100
+    LIVE_CACHE_LIMIT = 256
+    REFINEMENT_LIMIT = 50
+    
     def __init__(self):
         self.config = get_config()
         self.data_processor = CPRDataProcessor()
@@ -37,12 +222,29 @@ class CPRModelCore:
         self.chroma_client = None
         self.collection = None
         self.model = None
+        self.reranker = None  # CrossEncoder - SEARCH_CONFIG['rerank'] açıksa
         self.search_engine = None
+        self.llm = None  # OllamaClient - sunucu erişilebilirse
+        self.generation_cache = None
+        self.context_builder = None
+        
+        # Spekülatif mod - arka planda LLM iyileştirmeleri (id -> durum)
+        self._refinements = {}
+        self._refine_lock = threading.Lock()
         
         self.start_time = datetime.now()
         self.query_count = 0
         self.success_count = 0
         self.response_cache = {}
+        
+        # Hot reload durumu - bu oturumun kullandığı nesil (_SHARED_INDEX'ten)
+        self.kb_generation = 0
+        
+        # Ön hesaplama (prefetch) - kuyruk ve worker süreçte ortak (_PREFETCH)
+        self._prefetched_keys = set()
+        
+        # Canlı analiz memo'su - normalize metin -> analiz
+        self._live_cache = {}
     
     def start_system(self) -> bool:
         """Sistem başlat v3.0"""
@@ -53,6 +255,37 @@ class CPRModelCore:
             return False
         
         try:
+            # Model yükle
+            if not self._load_model():
+                return False
+            self._load_reranker()
+            
+            # Bilgi bankası süreçte bir kez kurulur - sonraki oturumlar hazır indeksi kullanır
+            if not self._init_shared_index():
+                return False
+            
+            # Güçlü arama sistemi
+            self._sync_shared_index()
+            
+            self.start_file_watcher()
+            self._init_llm()
+            
+            # "Rastgele" butonunun soruları önceden bilinir
+            self.prefetch(self.config['samples'])
+            
+            st.success("✅ CPR v3.0 hazır! (Güçlü Arama)")
+            return True
+        
+        except Exception as e:
+            st.error(f"❌ v3.0 Sistem hatası: {str(e)}")
+            return False
+    
+    def _init_shared_index(self) -> bool:
+        """JSON + ChromaDB + senkron - sadece süreçteki ilk oturumda çalışır"""
+        with _SHARED_INDEX.lock:
+            if _SHARED_INDEX.current[1] is not None:
+                return True
+            
             # JSON yükle
             if not self.data_processor.json_yukle():
                 return False
@@ -64,42 +297,51 @@ class CPRModelCore:
             if not self._init_chromadb():
                 return False
             
-            # Model yükle
-            if not self._load_model():
-                return False
-            
             # Database
             if not self._create_database():
                 return False
             
-            # Güçlü arama sistemi
-            self.search_engine = PowerfulSearchEngine(self.collection, self.model)
-            
-            st.success("✅ CPR v3.0 hazır! (Güçlü Arama)")
+            _SHARED_INDEX.publish(self.collection, self.data_processor, self._kb_mtime())
             return True
-            
-        except Exception as e:
-            st.error(f"❌ v3.0 Sistem hatası: {str(e)}")
-            return False
+    
+    def _sync_shared_index(self):
+        """Süreçte yeni nesil yayınlandıysa bu oturumun motorunu ona geçir"""
+        generation, collection, data_processor = _SHARED_INDEX.current
+        if collection is None or (generation == self.kb_generation and self.search_engine is not None):
+            return
+        
+        engine = PowerfulSearchEngine(collection, self.model, data_processor.bm25_index, self.reranker)
+        _SHARED_INDEX.track(engine)
+        
+        # Atomik değişim - devam eden sorgular eski motor ile tamamlanır
+        self.data_processor = data_processor
+        self.collection = collection
+        self.search_engine = engine
+        self.kb_generation = generation
+        self.response_cache.clear()
+        self._live_cache.clear()
+    
+    @property
+    def last_reload(self):
+        """Süreçteki son yeniden yüklemenin özeti"""
+        return _SHARED_INDEX.last_reload
     
     def _init_chromadb(self) -> bool:
         """ChromaDB başlat"""
         try:
-            self.chroma_client = chromadb.Client(Settings(
-                anonymized_telemetry=False,
-                allow_reset=True
-            ))
+            settings = Settings(anonymized_telemetry=False, allow_reset=True)
+            persist_directory = self.config['model'].get('persist_directory')
             
-            collection_name = self.config['model']['collection_name']
+            if persist_directory:
+                self.chroma_client = chromadb.PersistentClient(path=persist_directory, settings=settings)
+            else:
+                self.chroma_client = chromadb.Client(settings)
             
-            try:
-                self.collection = self.chroma_client.get_collection(collection_name)
+            # En yeni indeks nesli - önceki süreçten kalan eski nesiller silinir
+            self.collection = _SHARED_INDEX.open_active(self.chroma_client, self.config['model']['collection_name'])
+            if self.collection.count():
                 st.info(f"📊 v3.0 Database: {self.collection.count()} doküman")
-            except:
-                self.collection = self.chroma_client.create_collection(
-                    name=collection_name,
-                    metadata={"version": "v3_powerful"}
-                )
+            else:
                 st.info("🆕 v3.0 Database oluşturuldu")
             
             return True
@@ -123,55 +365,532 @@ class CPRModelCore:
             st.error(f"❌ Model hatası: {str(e)}")
             return False
     
+    def _load_reranker(self):
+        """İsteğe bağlı cross-encoder - yüklenemezse sistem bi-encoder sırasıyla devam eder"""
+        search_config = self.config['search']
+        if not search_config.get('rerank'):
+            return
+        if not CROSS_ENCODER_OK:
+            print("⚠️ CrossEncoder yok - yeniden sıralama kapalı")
+            return
+        
+        try:
+            with st.spinner("🎯 Yeniden sıralama modeli yükleniyor..."):
+                self.reranker = CrossEncoder(search_config['rerank_model'],
+                                             max_length=search_config['rerank_max_length'])
+            print(f"✅ Cross-encoder hazır: {search_config['rerank_model']}")
+        except Exception as e:
+            print(f"⚠️ Cross-encoder yüklenemedi: {e} - yeniden sıralama kapalı")
+            self.reranker = None
+    
     def _create_database(self) -> bool:
-        """Database oluştur"""
+        """Database oluştur / JSON ile artımlı senkronize et"""
         try:
-            if self.collection.count() > 0:
-                st.info("📊 v3.0 Database hazır")
-                return True
+            stats = self.sync_database()
             
-            st.info("📊 v3.0 Database oluşturuluyor...")
+            # Geçersiz/tekrar kayıtlar tek ingest geçişinden raporlanır
+            if stats['invalid'] or stats['duplicates']:
+                self.data_processor.gecersiz_rapor()
+            if not stats['upserted'] + stats['unchanged'] + stats['failed']:
+                st.error("❌ Veri yok!")
+                return False
             
-            documents = self.data_processor.batch_hazirla()
+            if stats['upserted'] or stats['deleted']:
+                st.success(f"✅ v3.0: {stats['upserted']} doküman eklendi/güncellendi, "
+                           f"{stats['deleted']} silindi, {stats['unchanged']} değişmedi")
+            else:
+                st.info(f"📊 v3.0 Database güncel ({stats['unchanged']} doküman)")
             
-            ids, embeddings, metadatas, contents = [], [], [], []
+            if stats['failed']:
+                st.warning(f"⚠️ {stats['failed']} doküman eklenemedi (konsol loguna bakın)")
+            return True
             
-            progress = st.progress(0)
-            for i, doc in enumerate(documents):
-                ids.append(doc['id'])
-                
-                embedding = self.model.encode(doc['embedding_icerik']).tolist()
-                embeddings.append(embedding)
-                
-                metadatas.append(doc['metadata'])
-                contents.append(doc['icerik'])
-                
-                progress.progress((i + 1) / len(documents))
+        except Exception as e:
+            st.error(f"❌ Database hatası: {str(e)}")
+            return False
+    
+    def _indexed_ids(self, collection) -> set:
+        """Koleksiyondaki tüm id'ler (sayfalı okuma, içerik çekilmez)"""
+        ids = set()
+        page_size = 1000
+        offset = 0
+        
+        while True:
+            page = collection.get(include=[], limit=page_size, offset=offset)
+            ids.update(page['ids'])
+            
+            if len(page['ids']) < page_size:
+                return ids
+            offset += page_size
+    
+    def sync_database(self, collection=None, data_processor: CPRDataProcessor = None,
+                      show_progress: bool = True, reuse_from=None) -> Dict[str, int]:
+        """JSON'u indeksle karşılaştır - sadece değişenleri embed et, silinenleri kaldır"""
+        collection = collection or self.collection
+        data_processor = data_processor or self.data_processor
+        batch_size = self.config['model']['embed_batch_size']
+        
+        # Yeni nesle senkronda (reuse_from) değişen/silinen sayıları önceki nesle göre
+        indexed_ids = self._indexed_ids(collection)
+        previous_ids = self._indexed_ids(reuse_from) if reuse_from is not None else indexed_ids
+        seen_ids = set()
+        stats = {'upserted': 0, 'deleted': 0, 'unchanged': 0, 'failed': 0}
+        status = st.empty() if show_progress else None
+        
+        # Dokümanlar akış halinde gelir - bellekte en fazla bir batch tutulur
+        for batch in _batched(data_processor.indeks_akisi(), batch_size):
+            seen_ids.update(doc['id'] for doc in batch)
+            upserted, failed = self._sync_batch(collection, batch, reuse_from)
+            stats['upserted'] += upserted
+            stats['failed'] += failed
+            stats['unchanged'] += len(batch) - upserted - failed
             
-            self.collection.add(
-                embeddings=embeddings,
-                metadatas=metadatas,
-                documents=contents,
-                ids=ids
+            if status:
+                status.text(f"📊 {len(seen_ids)} doküman işlendi, {stats['upserted']} embed edildi")
+        
+        # Geçersiz hale gelen kayıtların son geçerli sürümü (ve pasajları) indekste kalır
+        kept_ids = {kayit['id'] for kayit in data_processor.gecersiz_kayitlar if isinstance(kayit['id'], str)}
+        
+        def stale(doc_id):
+            return doc_id not in seen_ids and doc_id.split('#', 1)[0] not in kept_ids
+        
+        removed = [doc_id for doc_id in indexed_ids if stale(doc_id)]
+        if removed:
+            collection.delete(ids=removed)
+        stats['deleted'] = sum(1 for doc_id in previous_ids if stale(doc_id))
+        
+        # Yeni nesil boş başlar - korunan kayıtların satırları önceki nesilden kopyalanır
+        kept_rows = [doc_id for doc_id in previous_ids - indexed_ids - seen_ids
+                     if doc_id.split('#', 1)[0] in kept_ids]
+        stats['kept'] = self._copy_rows(reuse_from, collection, kept_rows) if kept_rows else 0
+        stats['invalid'] = len(data_processor.gecersiz_kayitlar)
+        stats['duplicates'] = len(data_processor.tekrar_kayitlar)
+        
+        if status:
+            status.empty()
+        
+        print(f"🔄 SENKRON: {stats['upserted']} değişen, {stats['deleted']} silinen, "
+              f"{stats['unchanged']} aynı, {stats['invalid']} geçersiz ({stats['kept']} korundu), "
+              f"{stats['duplicates']} tekrar, {stats['failed']} başarısız")
+        return stats
+    
+    def _sync_batch(self, collection, batch: List[Dict], reuse_from=None) -> Tuple[int, int]:
+        """Bir batch'i hedef koleksiyona yaz - (önceki sürüme göre değişen, başarısız)"""
+        existing = collection.get(ids=[doc['id'] for doc in batch], include=["metadatas"])
+        indexed = {doc_id: (metadata or {}).get('content_hash')
+                   for doc_id, metadata in zip(existing['ids'], existing['metadatas'])}
+        
+        to_write = [doc for doc in batch if indexed.get(doc['id']) != doc['metadata']['content_hash']]
+        if not to_write:
+            return 0, 0
+        
+        # Önceki nesilde aynı hash'li dokümanlar kopyalanır - embed edilmez, değişmemiş sayılır
+        embeddings = self._reusable_embeddings(reuse_from, to_write) if reuse_from is not None else {}
+        
+        to_encode = [doc for doc in to_write if doc['id'] not in embeddings]
+        changed_ids = {doc['id'] for doc in to_encode}
+        if to_encode:
+            encoded = self.model.encode([doc['embedding_icerik'] for doc in to_encode])
+            for doc, embedding in zip(to_encode, encoded):
+                embeddings[doc['id']] = embedding.tolist()
+        
+        try:
+            collection.upsert(
+                ids=[doc['id'] for doc in to_write],
+                embeddings=[embeddings[doc['id']] for doc in to_write],
+                metadatas=[doc['metadata'] for doc in to_write],
+                documents=[doc['icerik'] for doc in to_write]
             )
+            return len(changed_ids), 0
+        except Exception as e:
+            print(f"🚨 BATCH UPSERT HATASI: {str(e)} - doküman bazlı deneniyor")
+        
+        # Hatalı dokümanı izole et - hesaplanan embedding'ler yeniden kullanılır
+        changed = failed = 0
+        for doc in to_write:
+            try:
+                collection.upsert(
+                    ids=[doc['id']],
+                    embeddings=[embeddings[doc['id']]],
+                    metadatas=[doc['metadata']],
+                    documents=[doc['icerik']]
+                )
+                changed += doc['id'] in changed_ids
+            except Exception as e:
+                failed += 1
+                print(f"🚨 UPSERT HATASI ({doc['id']}): {str(e)}")
+        
+        return changed, failed
+    
+    def _copy_rows(self, source, target, ids: List[str]) -> int:
+        """Satırları embedding'leriyle olduğu gibi kopyala - kopyalanan sayı"""
+        batch_size = self.config['model']['embed_batch_size']
+        copied = 0
+        for start in range(0, len(ids), batch_size):
+            rows = source.get(ids=ids[start:start + batch_size],
+                              include=["documents", "metadatas", "embeddings"])
+            if not rows['ids']:
+                continue
+            try:
+                target.upsert(
+                    ids=rows['ids'],
+                    embeddings=[list(embedding) for embedding in rows['embeddings']],
+                    metadatas=rows['metadatas'],
+                    documents=rows['documents']
+                )
+                copied += len(rows['ids'])
+            except Exception as e:
+                print(f"🚨 KOPYALAMA HATASI: {str(e)}")
+        
+        return copied
+    
+    def _reusable_embeddings(self, source, documents: List[Dict]) -> Dict[str, list]:
+        """Kaynak koleksiyonda aynı content_hash ile duran embedding'ler"""
+        wanted = {doc['id']: doc['metadata']['content_hash'] for doc in documents}
+        found = source.get(ids=list(wanted), include=["metadatas", "embeddings"])
+        
+        reusable = {}
+        for doc_id, metadata, embedding in zip(found['ids'], found['metadatas'], found['embeddings']):
+            if (metadata or {}).get('content_hash') == wanted[doc_id]:
+                reusable[doc_id] = list(embedding)
+        
+        return reusable
+    
+    def _kb_mtime(self):
+        """Bilgi bankası dosyasının değişim zamanı"""
+        try:
+            return os.path.getmtime(self.config['model']['knowledge_base'])
+        except OSError:
+            return None
+    
+    def reload_knowledge_base(self, background: bool = True) -> bool:
+        """JSON'u yeniden yükle - yeni nesil arka planda kurulur, sonra tüm oturumlar için atomik değiştirilir"""
+        if not self.search_engine:
+            return False
+        
+        if not _SHARED_INDEX.lock.acquire(blocking=False):
+            print("⏳ Yeniden yükleme zaten sürüyor")
+            return False
+        
+        if background:
+            threading.Thread(target=self._reload_worker, daemon=True).start()
+            return True
+        
+        return self._reload_worker()
+    
+    def _reload_worker(self) -> bool:
+        """Yeni nesli kur ve yayınla (_SHARED_INDEX.lock çağıran tarafından alınmış olmalı)"""
+        start_time = time.time()
+        collection = mtime = None
+        try:
+            print("🔄 BİLGİ BANKASI YENİDEN YÜKLENİYOR...")
+            mtime = self._kb_mtime()
             
-            st.success(f"✅ v3.0: {len(documents)} doküman eklendi!")
-            progress.empty()
+            # Yeni işlemci - dokümanlar senkronizasyon sırasında dosyadan akıtılır
+            data_processor = CPRDataProcessor()
+            if not self.config['model']['streaming_ingest']:
+                data_processor.json_oku()
+            
+            # Benzersiz adlı yeni nesil - eski nesli kullanan oturumlar etkilenmez
+            _, previous, previous_processor = _SHARED_INDEX.current
+            collection = _SHARED_INDEX.new_collection(self.config['model']['collection_name'])
+            stats = self.sync_database(collection, data_processor, show_progress=False,
+                                       reuse_from=previous)
+            
+            # Açılışta reddedilecek veri yayınlanmaz - mevcut nesil hizmette kalır
+            if not stats['upserted'] + stats['unchanged']:
+                raise ValueError("geçerli kayıt yok - mevcut indeks korunuyor")
+            if self.config['model']['strict_validation'] and stats['invalid']:
+                raise ValueError(f"{stats['invalid']} geçersiz kayıt (strict_validation) - mevcut indeks korunuyor")
+            
+            # Korunan kayıtlar BM25 indeksinde de kalır
+            kept_ids = {kayit['id'] for kayit in data_processor.gecersiz_kayitlar if isinstance(kayit['id'], str)}
+            previous_index = previous_processor.bm25_index if previous_processor is not None else None
+            if previous_index is not None and data_processor.bm25_index is not None:
+                for doc_id in kept_ids & (previous_index.documents.keys() - data_processor.bm25_index.documents.keys()):
+                    data_processor.bm25_index.add(doc_id, *previous_index.documents[doc_id])
+            
+            _SHARED_INDEX.publish(collection, data_processor, mtime)
+            self._sync_shared_index()
+            
+            _SHARED_INDEX.last_reload = {
+                'success': True,
+                'time': datetime.now().isoformat(),
+                'duration': time.time() - start_time,
+                'collection': collection.name,
+                **stats
+            }
+            print(f"✅ YENİDEN YÜKLEME TAMAM: {stats}")
             return True
             
         except Exception as e:
-            st.error(f"❌ Database hatası: {str(e)}")
+            print(f"🚨 YENİDEN YÜKLEME HATASI: {str(e)}")
+            _SHARED_INDEX.last_reload = {'success': False, 'time': datetime.now().isoformat(), 'error': str(e)}
+            
+            # Yarım kalan/reddedilen nesil yayınlanmadı - kimse kullanmıyor
+            if collection is not None and collection is not _SHARED_INDEX.current[1]:
+                _SHARED_INDEX.retire(collection.name)
+            
+            # İzleyici aynı dosya sürümünü her aralıkta yeniden denemesin - sonraki kayıtta tekrar dener
+            if mtime is not None:
+                _SHARED_INDEX.mtime = mtime
             return False
+            
+        finally:
+            _SHARED_INDEX.lock.release()
     
-    def query(self, question: str) -> Dict:
-        """Ana sorgulama v3.0"""
-        print(f"\n🚀 v3.0 SORGU: '{question}'")
+    def start_file_watcher(self, interval: float = None):
+        """JSON değişimini izleyen arka plan thread'i - süreçte tek izleyici"""
+        interval = interval or self.config['model']['kb_watch_interval']
+        if not interval:
+            return
         
-        if not self.search_engine:
-            return {"success": False, "response": "❌ Sistem hazır değil!"}
+        with _SHARED_INDEX.lock:
+            if _SHARED_INDEX.watcher:
+                return
+            
+            def watch():
+                while True:
+                    time.sleep(interval)
+                    mtime = self._kb_mtime()
+                    if mtime is not None and mtime != _SHARED_INDEX.mtime:
+                        print("📁 Bilgi bankası değişti - yeniden yükleniyor")
+                        self.reload_knowledge_base(background=False)
+            
+            _SHARED_INDEX.watcher = threading.Thread(target=watch, daemon=True)
+            _SHARED_INDEX.watcher.start()
+    
+    def _init_llm(self):
+        """Üretken yanıt istemcisi - sunucu yoksa aşama kapalı kalır"""
+        if not self.config['llm'].get('enabled') or not REQUESTS_OK:
+            return
+        
+        client = OllamaClient()
+        if client.is_available():
+            self.llm = client
+            self.context_builder = ContextBuilder()
+            print(f"🤖 LLM hazır: {client.model} @ {client.base_url}")
+            
+            llm_config = self.config['llm']
+            if llm_config.get('cache_dir'):
+                self.generation_cache = GenerationCache(
+                    llm_config['cache_dir'], llm_config['cache_ttl'], llm_config['cache_max_entries']
+                )
+        else:
+            print(f"⚠️ LLM sunucusu erişilemez ({client.base_url}) - sadece retrieval yanıtı")
+    
+    def generate_stream(self, question: str, result: Dict, status: Dict = None) -> Iterator[str]:
+        """Retrieval sonucunun en iyi dokümanlarından üretken yanıt - token token (status['done']: tamamlandı)"""
+        status = status if status is not None else {}
+        if not self.llm_available(result):
+            return
+        
+        context = result['top_results'][:self.config['llm']['context_results']]
+        
+        # Aynı soru + aynı doküman içerikleri + aynı model/seçenekler = aynı üretim
+        cache_key = None
+        if self.generation_cache is not None:
+            cache_key = generation_key(question, context, self.llm.model, self.llm.generation_options())
+            cached = self.generation_cache.get(cache_key)
+            if cached is not None:
+                print("⚡ LLM CACHE HIT!")
+                status['done'] = True
+                yield cached
+                return
+        
+        # Token bütçesine paketlenmiş bağlam
+        prompt, pack_stats = self.context_builder.build_prompt(question, context)
+        print(f"📦 BAĞLAM: {pack_stats['documents']} doküman, {pack_stats['steps']} adım, "
+              f"{pack_stats['tokens']}/{pack_stats['budget']} token")
+        
+        tokens = []
+        for token in self.llm.generate_stream(prompt, status=status):
+            tokens.append(token)
+            yield token
+        
+        # Sadece tamamlanan üretimler saklanır
+        if cache_key and status.get('done'):
+            self.generation_cache.put(cache_key, "".join(tokens), self.llm.model)
+    
+    def prefetch(self, questions: List[str]) -> int:
+        """Soruları düşük öncelikli arka planda önceden hesapla - kuyruğa eklenen sayı"""
+        if not self.config['search'].get('prefetch_enabled') or not self.search_engine:
+            return 0
+        
+        # Yük altında üretilen sonuç cache'lenmez - ön hesaplama boşa iş olur
+        if self.search_engine.degradation_level():
+            return 0
+        
+        if self._prefetch_budget_full():
+            return 0
+        
+        with _PREFETCH.lock:
+            return _PREFETCH.add(self, questions)
+    
+    def _prefetch_one(self, question: str):
+        """Kuyruktan gelen soru - cache'te varsa, pay dolduysa veya yük varsa atlanır"""
+        key = question.strip().lower()
+        if key in self.response_cache or self._prefetch_budget_full():
+            return
+        if self.search_engine.degradation_level():
+            return
+        
+        self.query(question, prefetch=True)
+        if key in self.response_cache:
+            with _PREFETCH.lock:
+                self._prefetched_keys.add(key)
+    
+    def _prefetch_budget_full(self) -> bool:
+        """Cache dolu mu veya ön hesaplanan kayıtlar payını doldurdu mu"""
+        if len(self.response_cache) >= self.RESPONSE_CACHE_LIMIT:
+            return True
+        return self._prefetched_count() >= self.config['search']['prefetch_max_entries']
+    
+    def _prefetched_count(self) -> int:
+        """Cache'te duran ön hesaplanmış kayıtlar - küme worker eklerken kopyalanarak okunur"""
+        with _PREFETCH.lock:
+            keys = list(self._prefetched_keys)
+        return sum(1 for key in keys if key in self.response_cache)
+    
+    def live_analysis(self, question: str) -> Dict:
+        """Yazarken analiz - normalize metin değişmedikçe yeniden hesaplanmaz"""
+        self._sync_shared_index()
+        search_engine = self.search_engine
+        generation = self.kb_generation
+        if not search_engine:
+            return None
+        
+        key = ' '.join(question.lower().split())
+        cached = self._live_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        # Motorun kendi dedektörü - arama ile aynı kategori
+        analysis = search_engine.category_detector.analyze(question)
+        result = analysis.to_dict()
+        result['detected_category'] = analysis.detected_category
+        
+        # Ucuz sözcüksel tahmin - embedding/ChromaDB çağrısı yok
+        result['documents'] = []
+        top_k = self.config['search']['live_top_documents']
+        if top_k and search_engine.lexical_index is not None:
+            for doc_id, score in search_engine.lexical_index.search(question, top_k):
+                metadata = search_engine.lexical_index.documents[doc_id][1]
+                result['documents'].append({'id': doc_id, 'kategori': metadata.get('kategori', ''), 'bm25': score})
+        
+        if generation == self.kb_generation:
+            if len(self._live_cache) >= self.LIVE_CACHE_LIMIT:
+                self._live_cache.pop(next(iter(self._live_cache)))
+            self._live_cache[key] = result
+        
+        return result
+    
+    def query(self, question: str, prefetch: bool = False) -> Dict:
+        """Ana sorgulama v3.0 - prefetch sorguları istatistiğe girmez"""
+        if prefetch:
+            return self._query(question, prefetch=True)
+        
+        _PREFETCH.begin_query()
+        try:
+            return self._attach_refinement(question, self._query(question))
+        finally:
+            _PREFETCH.end_query()
+    
+    def query_stream(self, question: str) -> Iterator[Dict]:
+        """Akışlı sorgu - önce orijinal varyantın yanıtı (stage='preliminary'), en son nihai sonuç"""
+        _PREFETCH.begin_query()
+        try:
+            for result in self._query_stages(question, stream=True):
+                if result.get('stage') != 'preliminary':
+                    result = self._attach_refinement(question, result)
+                yield result
+        finally:
+            _PREFETCH.end_query()
+    
+    def llm_available(self, result: Dict) -> bool:
+        """Bu sonuç için üretken yanıt verilir mi - spekülatif ve doğrudan yol aynı kuralı kullanır"""
+        # Yük altında (no_fuzzy ve üstü) LLM'e ek iş verilmez
+        if result.get('degradation', 'full') in DEGRADATION_LEVELS[2:]:
+            return False
+        return bool(self.llm and result.get('top_results'))
+    
+    def _attach_refinement(self, question: str, result: Dict) -> Dict:
+        """Spekülatif mod - retrieval yanıtı hemen döner, LLM iyileştirmesi arka planda başlar"""
+        if self.config['llm'].get('speculative') and self.llm_available(result):
+            result['refinement_id'] = self.start_refinement(question, result)
+        return result
+    
+    def start_refinement(self, question: str, result: Dict) -> str:
+        """Arka plan üretimi başlat - aynı soru için çalışan/biten iyileştirme yeniden kullanılır"""
+        refinement_id = f"{self.kb_generation}:{' '.join(question.lower().split())}"
+        
+        with self._refine_lock:
+            existing = self._refinements.get(refinement_id)
+            if existing and existing['status'] != 'failed':
+                return refinement_id
+            
+            # Sınır - en eski biten iyileştirmeler düşer
+            if len(self._refinements) >= self.REFINEMENT_LIMIT:
+                for key in [k for k, v in self._refinements.items() if v['status'] != 'running']:
+                    del self._refinements[key]
+                    if len(self._refinements) < self.REFINEMENT_LIMIT:
+                        break
+            
+            state = {'status': 'running', 'text': '', 'started': time.time()}
+            self._refinements[refinement_id] = state
+        
+        worker = threading.Thread(target=self._refine_worker, args=(question, result, state), daemon=True)
+        worker.start()
+        return refinement_id
+    
+    def _refine_worker(self, question: str, result: Dict, state: Dict):
+        """Token'lar geldikçe durum metnine eklenir - UI yoklayarak okur"""
+        error = None
+        status = {}
+        try:
+            for token in self.generate_stream(question, result, status):
+                state['text'] += token
+        except Exception as e:
+            error = e
+        finally:
+            # Durum her koşulda kapanır - 'running' kalırsa UI zaman aşımına kadar bekler
+            # Zaman aşımı/sunucu hatasıyla kesilen yanıt 'done' değil - sonraki istek yeniden dener
+            completed = status.get('done') and state['text'] and error is None
+            state['status'] = 'done' if completed else 'failed'
+            state['elapsed'] = time.time() - state['started']
+            print(f"🤖 İYİLEŞTİRME {'✅' if state['status'] == 'done' else '❌'}: {state['elapsed']:.2f}s"
+                  + (f" ({error})" if error else ""))
+    
+    def refinement(self, refinement_id: str) -> Dict:
+        """İyileştirme durumu anlık görüntüsü - status: running/done/failed/unknown"""
+        state = self._refinements.get(refinement_id)
+        if state is None:
+            return {'status': 'unknown', 'text': ''}
+        return dict(state)
+    
+    def _query(self, question: str, prefetch: bool = False) -> Dict:
+        """Sorgu gövdesi - sadece nihai sonuç"""
+        result = None
+        for result in self._query_stages(question, prefetch):
+            pass
+        return result
+    
+    def _query_stages(self, question: str, prefetch: bool = False, stream: bool = False) -> Iterator[Dict]:
+        """Sorgu aşamaları - akışlı modda ara yanıtlar, son eleman her zaman nihai sonuç"""
+        print(f"\n🚀 v3.0 {'ÖN HESAPLAMA' if prefetch else 'SORGU'}: '{question}'")
+        
+        # Sorgu boyunca aynı motor - hot reload devam eden sorguyu etkilemez
+        self._sync_shared_index()
+        search_engine = self.search_engine
+        generation = self.kb_generation
+        
+        if not search_engine:
+            yield {"success": False, "response": "❌ Sistem hazır değil!"}
+            return
         
         start_time = time.time()
-        self.query_count += 1
+        if not prefetch:
+            self.query_count += 1
         
         # Cache
         cache_key = question.strip().lower()
@@ -179,32 +898,67 @@ class CPRModelCore:
             print("⚡ v3.0 CACHE HIT!")
             cached = self.response_cache[cache_key].copy()
             cached['cache_hit'] = True
-            return cached
+            yield cached
+            return
+        
+        # Yük seviyesi sorgu başında bir kez - tüm aşamalar aynı seviyede
+        level = search_engine.degradation_level()
         
         try:
-            # Güçlü arama
-            print("🎯 v3.0 Güçlü arama başlıyor...")
-            results = self.search_engine.powerful_search(question)
-            
-            # Eşik kontrolü
-            threshold = self.config['search']['default_threshold']
-            quality_results = [r for r in results if r['skor'] > threshold]
+            # Çok parçalı soru - alt sorgular tek batch'te aranır
+            sub_queries = [question]
+            if self.config['search'].get('multi_intent') and level < len(DEGRADATION_LEVELS) - 1:
+                sub_queries = search_engine.query_chunker.split(question)
             
-            print(f"📊 v3.0 ANALİZ:")
-            print(f"  - Toplam: {len(results)}")
-            print(f"  - Eşik: {threshold}")
-            print(f"  - Kaliteli: {len(quality_results)}")
-            
-            # Smart fallback
-            if not quality_results and results:
-                quality_results = results[:1]
-                print("🧠 v3.0 FALLBACK")
+            if level == len(DEGRADATION_LEVELS) - 1:
+                # cache_only - cache kaçırması sadece sözcüksel aramayla yanıtlanır
+                print("🪫 v3.0 YÜK: sadece cache + BM25")
+                results = search_engine.lexical_search(question)
+                quality_results = self._quality_results(results)
+            elif len(sub_queries) > 1:
+                print(f"🧩 v3.0 ÇOKLU SORU: {len(sub_queries)} alt sorgu")
+                raw_sections = search_engine.multi_intent_search(sub_queries, level)
+                sections = [(sub_query, self._quality_results(sub_results)) for sub_query, sub_results in raw_sections]
+                results = [r for _, sub_results in raw_sections for r in sub_results]
+                # Alt soruların sıralamaları (yeniden sıralama dahil) korunur - sıra sıra iç içe geçer
+                quality_results = [r for _, r in sorted(
+                    ((rank, si), r) for si, (_, sub_results) in enumerate(sections)
+                    for rank, r in enumerate(sub_results)
+                )]
+            elif stream:
+                # Akışlı arama - orijinal varyantın sonucu hemen gösterilir
+                print("🎯 v3.0 Akışlı arama başlıyor...")
+                for stage, results in search_engine.powerful_search_stream(question, level):
+                    if stage != 'preliminary':
+                        break
+                    preliminary = self._quality_results(results)
+                    if preliminary:
+                        yield {
+                            "success": True,
+                            "stage": "preliminary",
+                            "response": self.response_generator.generate_response(question, preliminary),
+                            "best_score": preliminary[0]['skor'],
+                            "response_time": time.time() - start_time,
+                            "version": "v3.0",
+                            "degradation": DEGRADATION_LEVELS[level],
+                            "cache_hit": False
+                        }
+                quality_results = self._quality_results(results)
+            else:
+                # Güçlü arama
+                print("🎯 v3.0 Güçlü arama başlıyor...")
+                results = search_engine.powerful_search(question, level)
+                quality_results = self._quality_results(results)
             
             # Yanıt oluştur
             if quality_results:
-                self.success_count += 1
+                if not prefetch:
+                    self.success_count += 1
                 print(f"✅ v3.0 BAŞARI: {quality_results[0]['skor']:.3f}")
-                response_text = self.response_generator.generate_response(question, quality_results)
+                if len(sub_queries) > 1:
+                    response_text = self.response_generator.generate_multi_response(question, sections)
+                else:
+                    response_text = self.response_generator.generate_response(question, quality_results)
                 success = True
                 best_score = quality_results[0]['skor']
             else:
@@ -222,20 +976,44 @@ class CPRModelCore:
                 "total_results": len(results),
                 "quality_results": len(quality_results),
                 "response_time": response_time,
+                "sub_queries": len(sub_queries),
+                "top_results": [
+                    {'id': r['id'], 'kategori': r['kategori'], 'icerik': r['icerik'], 'skor': r['skor']}
+                    for r in quality_results[:self.config['llm']['context_results']]
+                ],
+                "stage": "final",
                 "version": "v3.0",
+                "degradation": DEGRADATION_LEVELS[level],
                 "cache_hit": False
             }
             
-            # Cache kaydet
-            if len(self.response_cache) < 100:
+            # Cache kaydet - arada yeniden yükleme olduysa veya yük altında üretildiyse saklama
+            if (len(self.response_cache) < self.RESPONSE_CACHE_LIMIT and generation == self.kb_generation
+                    and not level):
                 self.response_cache[cache_key] = result.copy()
             
             print(f"📊 v3.0 SONUÇ: {'✅' if success else '❌'}")
-            return result
+            yield result
             
         except Exception as e:
             print(f"🚨 v3.0 HATA: {str(e)}")
-            return {"success": False, "response": f"❌ v3.0 Hata: {str(e)}"}
+            yield {"success": False, "response": f"❌ v3.0 Hata: {str(e)}"}
+    
+    def _quality_results(self, results: List[Dict]) -> List[Dict]:
+        """Eşik üstü sonuçlar - hiç yoksa en iyi sonuç (smart fallback)"""
+        threshold = self.config['search']['default_threshold']
+        quality_results = [r for r in results if r['skor'] > threshold]
+        
+        print(f"📊 v3.0 ANALİZ:")
+        print(f"  - Toplam: {len(results)}")
+        print(f"  - Eşik: {threshold}")
+        print(f"  - Kaliteli: {len(quality_results)}")
+        
+        if not quality_results and results:
+            quality_results = results[:1]
+            print("🧠 v3.0 FALLBACK")
+        
+        return quality_results
     
     def get_stats(self) -> Dict:
         """v3.0 Stats"""
@@ -249,6 +1027,10 @@ class CPRModelCore:
             'success_count': self.success_count,
             'success_rate': f"{(self.success_count/max(1,self.query_count))*100:.1f}%",
             'cache_size': len(self.response_cache),
+            'prefetched': self._prefetched_count(),
+            'degradation': DEGRADATION_LEVELS[self.search_engine.degradation_level()] if self.search_engine else None,
+            'llm': self.llm.stats.copy() if self.llm else None,
+            'generation_cache': self.generation_cache.stats.copy() if self.generation_cache is not None else None,
             'uptime': str(uptime).split('.')[0],
             'version': 'v3.0 Güçlü Sistem'
         }
@@ -2,10 +2,169 @@
 """Çoklu embedding, akıllı scoring, gelişmiş kategori tespiti"""
 
 import re
-from typing import List, Dict, Tuple
+import time
+import random
+import threading
+from collections import deque
+from types import MappingProxyType
+from typing import List, Dict, Tuple, Iterator
 from difflib import SequenceMatcher
 from config import get_config
 
+# Lokal yeniden skorlama için
+try:
+    import numpy as np
+    NUMPY_OK = True
+except ImportError:
+    NUMPY_OK = False
+
+# Modül seviyesinde derlenmiş kalıplar - her sorguda yeniden derlenmesin
+_QUESTION_RE = re.compile(r'\b(nasıl|nedir|ne|kaç|hangi|nerede)\b')
+_NUMBER_RE = re.compile(r'\d+')
+_DOSE_RE = re.compile(r'\b(mg|doz|miktar|gram)\b')
+_PROCEDURE_RE = re.compile(r'\b(nasıl|adım|prosedür|yöntem)\b')
+_PEDIATRIC_RE = re.compile(r'\b(çocuk|bebek|pediatrik)\b')
+_EMERGENCY_RE = re.compile(r'\b(acil|kritik|arrest|durma)\b')
+
+_HOW_RE = re.compile(r'\b(nasıl|ne şekilde)\b', re.I)
+_WHAT_RE = re.compile(r'\b(nedir|ne|tanım)\b', re.I)
+_AMOUNT_RE = re.compile(r'\b(kaç|ne kadar|miktar)\b', re.I)
+
+_STEP_NUMBER_RE = re.compile(r'\d+\.')
+
+# Çok parçalı soru bölme kalıpları
+_NUMBERED_ITEM_RE = re.compile(r'^\s*\d+[.)]\s+(.+?)\s*$', re.M)
+_SUB_QUESTION_RE = re.compile(r'[^?]+\?')
+
+# Sabit tablolar - her çağrıda yeniden kurulmasın
+SEMANTIC_MAP = MappingProxyType({
+    'kalp': ('cardiac', 'miyokard', 'ventrikül', 'atrium'),
+    'nefes': ('solunum', 'respiration', 'oksigen', 'ventilation'),
+    'çocuk': ('pediatrik', 'infant', 'baby', 'küçük'),
+    'acil': ('emergency', 'kritik', 'urgent', 'arrest')
+})
+
+DRUG_CONTEXT_WORDS = frozenset({'epinefrin', 'adrenalin', 'ilaç'})
+AED_CONTEXT_WORDS = frozenset({'aed', 'defibrillatör', 'şok'})
+
+CATEGORY_RELATIONS = MappingProxyType({
+    'cpr': frozenset({'çocuk', 'acil'}),
+    'aed': frozenset({'cpr', 'acil'}),
+    'ilaç': frozenset({'cpr', 'acil'}),
+    'çocuk': frozenset({'cpr'}),
+    'acil': frozenset({'cpr', 'aed', 'ilaç'})
+})
+
+HIGH_VALUE_WORDS = ('epinefrin', 'aed', 'kompresyon', 'defibrilasyon', 'entübasyon')
+
+# Yük altında kademeli bozulma - indeks = seviye
+DEGRADATION_LEVELS = ('full', 'reduced_variants', 'no_fuzzy', 'cache_only')
+
+class LoadTracker:
+    """Süreç genelinde yük durumu - eşzamanlı arama sayısı ve son gecikmeler (zaman, süre)"""
+    
+    def __init__(self, max_samples: int):
+        self.in_flight = 0
+        self.latencies = deque(maxlen=max_samples)
+        self.lock = threading.Lock()
+    
+    def begin(self):
+        with self.lock:
+            self.in_flight += 1
+    
+    def end(self):
+        with self.lock:
+            self.in_flight -= 1
+    
+    def record(self, response_time: float):
+        with self.lock:
+            self.latencies.append((time.time(), response_time))
+    
+    def p95(self, window_seconds: float, min_samples: int) -> float:
+        """Son window_seconds içindeki aramaların p95 gecikmesi - az örnekte 0"""
+        horizon = time.time() - window_seconds
+        with self.lock:
+            recent = sorted(latency for finished, latency in self.latencies if finished >= horizon)
+        
+        if len(recent) < min_samples:
+            return 0.0
+        return recent[min(len(recent) - 1, int(len(recent) * 0.95))]
+
+# Streamlit her oturuma ayrı motor verir - yük tüm oturumlar için tek yerde ölçülür
+LOAD_TRACKER = LoadTracker(get_config()['search']['degradation_max_samples'])
+
+def split_steps(content: str) -> List[str]:
+    """Metni numaralı adımlara, yoksa cümlelere böl"""
+    if not content:
+        return ["İçerik bulunamadı"]
+    
+    if _STEP_NUMBER_RE.search(content):
+        steps = _STEP_NUMBER_RE.split(content)[1:]
+        clean_steps = [step.strip() for step in steps if step.strip()]
+        if clean_steps:
+            return clean_steps
+    
+    if '. ' in content:
+        steps = content.split('. ')
+        clean_steps = [step.strip() for step in steps if len(step.strip()) > 10]
+        if clean_steps:
+            return clean_steps
+    
+    return [content]
+
+def _fuzzy_ratio(word: str, term: str) -> float:
+    """Eşik altı çiftleri ucuz üst sınırlarla ele - eşik altında 0.0 döner"""
+    # real_quick_ratio üst sınırı: uzunluk farkı büyükse benzerlik imkansız
+    total = len(word) + len(term)
+    if 2.0 * min(len(word), len(term)) / total <= FUZZY_EXPAND_THRESHOLD:
+        return 0.0
+    
+    matcher = SequenceMatcher(None, word, term)
+    if matcher.quick_ratio() <= FUZZY_EXPAND_THRESHOLD:
+        return 0.0
+    
+    return matcher.ratio()
+
+# Fuzzy eşikleri - expander daha toleranslı, detector daha katı
+FUZZY_EXPAND_THRESHOLD = 0.75
+FUZZY_CATEGORY_THRESHOLD = 0.8
+
+class QueryAnalysis:
+    """Sorgu başına bir kez hesaplanan ortak analiz - detector ve expander paylaşır"""
+    
+    def __init__(self, query: str, tokens: List[str], features: Dict[str, bool],
+                 category_scores: Dict[str, float], fuzzy_hits: Dict[str, List[Tuple[str, float]]]):
+        self.query = query
+        self.query_lower = query.lower().strip()
+        self.tokens = tokens
+        self.words = set(tokens)
+        self.features = features
+        self.category_scores = category_scores
+        self.fuzzy_hits = fuzzy_hits  # terim -> [(kelime, benzerlik)] token sırasıyla
+        
+        # Tek kategori kararı - iki alt sistem de bunu kullanır
+        self.detected_category = max(category_scores, key=category_scores.get) if category_scores else None
+        self.primary_category = self.detected_category or 'cpr'
+        self.confidence = category_scores.get(self.primary_category, 0) / max(sum(category_scores.values()), 1)
+        
+        word_count = len(tokens)
+        if word_count <= 3:
+            self.complexity = 'basit'
+        elif word_count <= 6:
+            self.complexity = 'orta'
+        else:
+            self.complexity = 'karmaşık'
+    
+    def to_dict(self) -> Dict[str, any]:
+        """Eski analiz sözlüğü formatı"""
+        return {
+            'primary_category': self.primary_category,
+            'confidence': self.confidence,
+            'all_scores': self.category_scores,
+            'features': self.features,
+            'complexity': self.complexity
+        }
+
 class PowerfulWordExpander:
     """Çok güçlü kelime genişletme sistemi"""
     
@@ -13,23 +172,25 @@ class PowerfulWordExpander:
         self.word_map = get_config()['word_map']
         self.categories = get_config()['categories']
     
-    def multi_expand(self, query: str) -> Tuple[str, str, str]:
+    def multi_expand(self, query: str, analysis: 'QueryAnalysis' = None) -> Tuple[str, str, str]:
         """3 farklı genişletme stratejisi"""
+        if analysis is None:
+            analysis = AdvancedCategoryDetector().analyze(query)
         
         # 1. TEMEL GENİŞLETME - Hızlı
-        basic = self._basic_expand(query)
+        basic = self._basic_expand(analysis)
         
         # 2. AKILLI GENİŞLETME - Fuzzy + Context
-        smart = self._smart_expand(query)
+        smart = self._smart_expand(analysis)
         
         # 3. DERİN GENİŞLETME - Kategori + Semantic
-        deep = self._deep_expand(query)
+        deep = self._deep_expand(analysis)
         
         return basic, smart, deep
     
-    def _basic_expand(self, query: str) -> str:
+    def _basic_expand(self, analysis: 'QueryAnalysis') -> str:
         """Temel genişletme"""
-        expanded = query.lower()
+        expanded = analysis.query.lower()
         
         # Direkt eş anlamlı ekleme
         for key, synonyms in self.word_map.items():
@@ -38,78 +199,57 @@ class PowerfulWordExpander:
         
         return expanded
     
-    def _smart_expand(self, query: str) -> str:
+    def _smart_expand(self, analysis: 'QueryAnalysis') -> str:
         """Akıllı genişletme"""
+        query = analysis.query
         expanded = query.lower()
-        words = query.lower().split()
         
-        # 1. Fuzzy eşleşmeler
+        # 1. Fuzzy eşleşmeler - analizde bir kez hesaplandı
         for key, synonyms in self.word_map.items():
-            for word in words:
-                if len(word) > 3 and len(key) > 3:
-                    similarity = SequenceMatcher(None, word, key).ratio()
-                    if similarity > 0.75:  # %75+ benzer
-                        expanded += f" {key} " + " ".join(synonyms[:2])
+            for word, similarity in analysis.fuzzy_hits.get(key, []):
+                if similarity > FUZZY_EXPAND_THRESHOLD:  # %75+ benzer
+                    expanded += f" {key} " + " ".join(synonyms[:2])
         
         # 2. Soru tipi analizi
-        if re.search(r'\b(nasıl|ne şekilde)\b', query, re.I):
+        if _HOW_RE.search(query):
             expanded += " prosedür yöntem adım protokol teknik"
         
-        if re.search(r'\b(nedir|ne|tanım)\b', query, re.I):
+        if _WHAT_RE.search(query):
             expanded += " açıklama definition bilgi detay"
             
-        if re.search(r'\b(kaç|ne kadar|miktar)\b', query, re.I):
+        if _AMOUNT_RE.search(query):
             expanded += " doz sayı amount mg milligram"
         
         # 3. Sayısal değer tespiti
-        if re.search(r'\d+', query):
+        if analysis.features['has_numbers']:
             expanded += " doz miktar mg cc ml gram"
         
         return expanded
     
-    def _deep_expand(self, query: str) -> str:
+    def _deep_expand(self, analysis: 'QueryAnalysis') -> str:
         """Derin genişletme"""
-        expanded = query.lower()
-        words = set(query.lower().split())
+        expanded = analysis.query.lower()
+        words = analysis.words
         
-        # 1. Kategori tespit ve genişletme
-        best_category, best_score = self._detect_category(words)
+        # 1. Kategori genişletme - detector ile aynı karar
+        best_category = analysis.detected_category
         if best_category:
             category_words = self.categories.get(best_category, [])
             expanded += " " + " ".join(category_words[:3])
         
         # 2. Semantic genişletme - ilişkili kavramlar
-        semantic_map = {
-            'kalp': ['cardiac', 'miyokard', 'ventrikül', 'atrium'],
-            'nefes': ['solunum', 'respiration', 'oksigen', 'ventilation'],
-            'çocuk': ['pediatrik', 'infant', 'baby', 'küçük'],
-            'acil': ['emergency', 'kritik', 'urgent', 'arrest']
-        }
-        
-        for key, related in semantic_map.items():
+        for key, related in SEMANTIC_MAP.items():
             if key in expanded:
                 expanded += " " + " ".join(related[:2])
         
         # 3. Bağlam genişletmesi
-        if any(word in words for word in ['epinefrin', 'adrenalin', 'ilaç']):
+        if not DRUG_CONTEXT_WORDS.isdisjoint(words):
             expanded += " vazopresor mg doz IV intravenöz uygulaması"
         
-        if any(word in words for word in ['aed', 'defibrillatör', 'şok']):
+        if not AED_CONTEXT_WORDS.isdisjoint(words):
             expanded += " elektrot pad joule energy bifazik monofazik"
         
         return expanded
-    
-    def _detect_category(self, words: set) -> Tuple[str, float]:
-        """Basit kategori tespiti"""
-        best_cat, best_score = None, 0
-        
-        for category, keywords in self.categories.items():
-            overlap = len(words & set(keywords))
-            if overlap > best_score:
-                best_score = overlap
-                best_cat = category
-                
-        return best_cat, best_score
 
 class AdvancedCategoryDetector:
     """Gelişmiş kategori tespit sistemi"""
@@ -117,31 +257,50 @@ class AdvancedCategoryDetector:
     def __init__(self):
         self.categories = get_config()['categories']
         self.word_map = get_config()['word_map']
+        
+        # Fuzzy karşılaştırılacak terimler - tekrarsız, sıralı
+        self.fuzzy_terms = []
+        for term in list(self.word_map) + [kw for kws in self.categories.values() for kw in kws]:
+            if len(term) > 3 and term not in self.fuzzy_terms:
+                self.fuzzy_terms.append(term)
     
-    def analyze_query(self, query: str) -> Dict[str, any]:
-        """Tam sorgu analizi"""
+    def analyze(self, query: str, fuzzy: bool = True) -> QueryAnalysis:
+        """Tek geçişte sorgu analizi - expander ile paylaşılır (fuzzy=False: yük altında atlanır)"""
         query_lower = query.lower().strip()
-        words = set(query_lower.split())
+        tokens = query_lower.split()
+        words = set(tokens)
         
-        # 1. Kategori skorları
-        category_scores = self._calculate_category_scores(query_lower, words)
+        fuzzy_hits = self._find_fuzzy_hits(tokens) if fuzzy else {}
+        category_scores = self._calculate_category_scores(query_lower, words, fuzzy_hits)
+        features = self._extract_features(query_lower, tokens)
         
-        # 2. En iyi kategori
-        best_category = max(category_scores, key=category_scores.get) if category_scores else 'cpr'
-        confidence = category_scores.get(best_category, 0) / max(sum(category_scores.values()), 1)
+        return QueryAnalysis(query, tokens, features, category_scores, fuzzy_hits)
+    
+    def analyze_query(self, query: str) -> Dict[str, any]:
+        """Tam sorgu analizi"""
+        return self.analyze(query).to_dict()
+    
+    def _find_fuzzy_hits(self, tokens: List[str]) -> Dict[str, List[Tuple[str, float]]]:
+        """Kelime-terim fuzzy benzerliklerini bir kez hesapla"""
+        hits = {}
+        ratios = {}
         
-        # 3. Sorgu özellikleri
-        features = self._extract_features(query_lower)
+        for term in self.fuzzy_terms:
+            for word in tokens:
+                if len(word) <= 3:
+                    continue
+                
+                pair = (word, term)
+                if pair not in ratios:
+                    ratios[pair] = _fuzzy_ratio(word, term)
+                
+                if ratios[pair] > FUZZY_EXPAND_THRESHOLD:
+                    hits.setdefault(term, []).append((word, ratios[pair]))
         
-        return {
-            'primary_category': best_category,
-            'confidence': confidence,
-            'all_scores': category_scores,
-            'features': features,
-            'complexity': self._assess_complexity(query)
-        }
+        return hits
     
-    def _calculate_category_scores(self, query: str, words: set) -> Dict[str, float]:
+    def _calculate_category_scores(self, query: str, words: set,
+                                   fuzzy_hits: Dict[str, List[Tuple[str, float]]]) -> Dict[str, float]:
         """Kategori skorlarını hesapla"""
         scores = {}
         
@@ -157,115 +316,157 @@ class AdvancedCategoryDetector:
             intersection = words & set(keywords)
             score += len(intersection) * 3
             
-            # Fuzzy eşleşmeler - 1 puan
+            # Fuzzy eşleşmeler - 1 puan (tekrarsız kelime başına)
             for keyword in keywords:
-                for word in words:
-                    if len(word) > 3 and len(keyword) > 3:
-                        similarity = SequenceMatcher(None, word, keyword).ratio()
-                        if similarity > 0.8:
-                            score += 1
+                matched = {word for word, similarity in fuzzy_hits.get(keyword, [])
+                           if similarity > FUZZY_CATEGORY_THRESHOLD}
+                score += len(matched)
             
             if score > 0:
                 scores[category] = score
         
         return scores
     
-    def _extract_features(self, query: str) -> Dict[str, bool]:
+    def _extract_features(self, query: str, tokens: List[str]) -> Dict[str, bool]:
         """Sorgu özelliklerini çıkar"""
         return {
-            'has_question': bool(re.search(r'\b(nasıl|nedir|ne|kaç|hangi|nerede)\b', query)),
-            'has_numbers': bool(re.search(r'\d+', query)),
-            'has_dose': bool(re.search(r'\b(mg|doz|miktar|gram)\b', query)),
-            'has_procedure': bool(re.search(r'\b(nasıl|adım|prosedür|yöntem)\b', query)),
-            'is_pediatric': bool(re.search(r'\b(çocuk|bebek|pediatrik)\b', query)),
-            'is_emergency': bool(re.search(r'\b(acil|kritik|arrest|durma)\b', query)),
-            'is_detailed': len(query.split()) > 6
+            'has_question': bool(_QUESTION_RE.search(query)),
+            'has_numbers': bool(_NUMBER_RE.search(query)),
+            'has_dose': bool(_DOSE_RE.search(query)),
+            'has_procedure': bool(_PROCEDURE_RE.search(query)),
+            'is_pediatric': bool(_PEDIATRIC_RE.search(query)),
+            'is_emergency': bool(_EMERGENCY_RE.search(query)),
+            'is_detailed': len(tokens) > 6
         }
+
+class QueryChunker:
+    """Çok parçalı soruları alt sorgulara böl (eski akilli_chunking'den)"""
+    
+    def __init__(self):
+        self.config = get_config()
     
-    def _assess_complexity(self, query: str) -> str:
-        """Sorgu karmaşıklığını değerlendir"""
-        word_count = len(query.split())
+    def split(self, query: str) -> List[str]:
+        """Alt sorgular - bölünemeyen sorgu tek elemanlı liste döner"""
+        search_config = self.config['search']
+        if len(query.split()) < search_config['multi_intent_min_words']:
+            return [query]
         
-        if word_count <= 3:
-            return 'basit'
-        elif word_count <= 6:
-            return 'orta'
-        else:
-            return 'karmaşık'
+        # Sadece açık ayrımlar: numaralı maddeler veya birden fazla soru cümlesi
+        # ('ve'/virgül bölmesi öznesiz parçalar üretiyordu - '... ve uygulama şekli nedir?')
+        parts = self._numbered_parts(query) or self._question_parts(query)
+        
+        unique_parts = []
+        seen = set()
+        for part in parts:
+            key = part.lower()
+            if key not in seen:
+                seen.add(key)
+                unique_parts.append(part)
+        
+        if len(unique_parts) < 2:
+            return [query]
+        
+        return unique_parts[:search_config['max_sub_queries']]
+    
+    def _numbered_parts(self, query: str) -> List[str]:
+        """'1. ... 2. ...' maddeleri - maddelerden önceki satır ortak bağlam olur"""
+        items = list(_NUMBERED_ITEM_RE.finditer(query))
+        if len(items) < 2:
+            return []
+        
+        preamble = [line.strip() for line in query[:items[0].start()].splitlines() if line.strip()]
+        context = preamble[-1].rstrip(':').strip() if preamble else ''
+        
+        return [f"{context} {item.group(1)}" if context else item.group(1) for item in items]
+    
+    def _question_parts(self, query: str) -> List[str]:
+        """Birden fazla soru cümlesi"""
+        questions = [q.strip() for q in _SUB_QUESTION_RE.findall(query) if len(q.split()) >= 2]
+        return questions if len(questions) >= 2 else []
 
 class PowerfulSearchEngine:
     """Güçlü arama motoru - çoklu strateji"""
     
-    def __init__(self, collection, model):
+    def __init__(self, collection, model, lexical_index=None, reranker=None):
         self.collection = collection
         self.model = model
+        self.lexical_index = lexical_index  # BM25Index (data_processor)
+        self.reranker = reranker  # CrossEncoder (isteğe bağlı) - son top-N yeniden sıralama
         self.config = get_config()
         
+        # Cross-encoder skorları - (normalize sorgu, doküman/pasaj id) -> skor
+        self._rerank_cache = {}
+        
         # Güçlü alt sistemler
         self.word_expander = PowerfulWordExpander()
         self.category_detector = AdvancedCategoryDetector()
+        self.query_chunker = QueryChunker()
         
         # Performance tracking
         self.search_stats = {
             'total_searches': 0,
             'multi_embedding_used': 0,
             'category_accuracy': {},
-            'avg_response_time': 0
+            'avg_response_time': 0,
+            'vector_store_queries': 0,
+            'shared_candidate_searches': 0,
+            'pruned_variants': 0,
+            'early_exits': 0,
+            'early_exit_shadow_checks': 0,
+            'early_exit_shadow_changed': 0,
+            'reranked_searches': 0,
+            'rerank_pairs': 0,
+            'rerank_cache_hits': 0,
+            'prefiltered_searches': 0,
+            'prefilter_fallbacks': 0,
+            'hybrid_fusions': 0,
+            'multi_intent_searches': 0,
+            'streamed_searches': 0,
+            'degraded_searches': {level: 0 for level in DEGRADATION_LEVELS[1:]}
         }
+        
+        # Yük takibi süreç genelinde paylaşılır - gölge kontrol istatistikleri motor başına
+        self.load_tracker = LOAD_TRACKER
+        self._stats_lock = threading.Lock()
     
-    def powerful_search(self, query: str) -> List[Dict]:
-        """Güçlü çoklu arama stratejisi"""
-        import time
+    def powerful_search(self, query: str, level: int = None) -> List[Dict]:
+        """Güçlü çoklu arama stratejisi - level verilmezse yüke göre seçilir"""
         start_time = time.time()
+        level = self._search_level(level)
         
         self.search_stats['total_searches'] += 1
+        self._begin_search(level)
         
         try:
             print(f"🚀 GÜÇLİ ARAMA BAŞLADI: '{query}'")
             
-            # 1. Sorgu analizi
-            analysis = self.category_detector.analyze_query(query)
-            primary_category = analysis['primary_category']
-            confidence = analysis['confidence']
-            features = analysis['features']
-            
-            print(f"📊 ANALİZ: Kategori={primary_category}, Güven={confidence:.2f}")
-            print(f"🔍 ÖZELLİKLER: {features}")
+            # 1-3. Analiz, çoklu genişletme, ön filtre
+            analysis, queries, where = self._search_plan(query, level)
+            primary_category = analysis.primary_category
             
-            # 2. Çoklu genişletme
-            basic_exp, smart_exp, deep_exp = self.word_expander.multi_expand(query)
+            # Tek round-trip - orijinal güvenli eşleşirse diğer varyantlar skorlanmaz/aranmaz
+            early_exit_enabled = bool(self.config['search'].get('early_exit')) and len(queries) > 1
+            all_results, early_exit = self._retrieve_variants(queries, primary_category, where, early_exit_enabled)
+            if early_exit:
+                # Füzyon skorları yerinde günceller - gölge karşılaştırma için orijinaller korunur
+                original_hits = all_results
+                all_results = [dict(r) for r in original_hits]
             
-            print(f"🔄 GENİŞLETME:")
-            print(f"  Basic: {basic_exp[:50]}...")
-            print(f"  Smart: {smart_exp[:50]}...")
-            print(f"  Deep:  {deep_exp[:50]}...")
-            
-            # 3. Çoklu embedding arama
-            all_results = []
-            
-            # Her genişletilmiş sorgu için arama
-            queries = [
-                ("original", query, 1.0),
-                ("basic", basic_exp, 0.9),
-                ("smart", smart_exp, 1.1), 
-                ("deep", deep_exp, 0.8)
-            ]
-            
-            for query_type, query_text, weight in queries:
-                results = self._single_search(query_text, primary_category, weight)
-                all_results.extend(results)
-                print(f"  {query_type}: {len(results)} sonuç")
+            # Seyrek sonuçta global aramaya dön
+            if self._prefilter_too_sparse(where, all_results):
+                all_results = self._retrieve(queries, primary_category, None)
             
             self.search_stats['multi_embedding_used'] += 1
             
             # 4. Sonuçları birleştir ve optimize et
             final_results = self._merge_and_optimize(all_results, analysis)
+            if early_exit:
+                self._shadow_check(analysis, queries, where, original_hits, final_results)
+            final_results = self._rerank(query, final_results, level)
             
             # 5. Performance tracking
             response_time = time.time() - start_time
-            self.search_stats['avg_response_time'] = (
-                self.search_stats['avg_response_time'] + response_time
-            ) / 2
+            self._record_latency(response_time)
             
             print(f"✅ GÜÇLİ ARAMA BİTTİ: {len(final_results)} final sonuç, {response_time:.2f}s")
             
@@ -274,8 +475,410 @@ class PowerfulSearchEngine:
         except Exception as e:
             print(f"🚨 GÜÇLİ ARAMA HATASI: {str(e)}")
             return []
+        
+        finally:
+            self._end_search()
+    
+    def powerful_search_stream(self, query: str, level: int = None) -> Iterator[Tuple[str, List[Dict]]]:
+        """Akışlı arama - önce orijinal varyantın sıralaması ('preliminary'), sonra tüm varyantlar ('final')"""
+        start_time = time.time()
+        level = self._search_level(level)
+        
+        self.search_stats['total_searches'] += 1
+        self.search_stats['streamed_searches'] += 1
+        self._begin_search(level)
+        
+        try:
+            print(f"🚀 AKIŞLI ARAMA BAŞLADI: '{query}'")
+            analysis, queries, where = self._search_plan(query, level)
+            primary_category = analysis.primary_category
+            
+            # Orijinal varyant tek başına - ilk yanıt için yeterli (ağırlığı budanan eşlerinden gelebilir)
+            original_hits = self._single_search(query, primary_category, queries[0][2], where)
+            
+            # Füzyon skorları yerinde günceller - ön sıralama kopyalar üzerinden
+            preliminary = self._merge_and_optimize([dict(r) for r in original_hits], analysis)
+            print(f"⚡ ÖN SONUÇ: {len(preliminary)} sonuç, {time.time() - start_time:.2f}s")
+            yield 'preliminary', preliminary
+            
+            # Güvenli eşleşme - ön sıralama nihai sonuçtur
+            if self.config['search'].get('early_exit') and self._confident_match(original_hits, where):
+                self._shadow_check(analysis, queries, where, original_hits, preliminary)
+                final_results = self._rerank(query, preliminary, level)
+                self._record_latency(time.time() - start_time)
+                yield 'final', final_results
+                return
+            
+            # Kalan varyantlar - orijinalin isabetleri yeniden kullanılır
+            all_results = original_hits + self._retrieve(queries[1:], primary_category, where)
+            if self._prefilter_too_sparse(where, all_results):
+                all_results = self._retrieve(queries, primary_category, None)
+            
+            self.search_stats['multi_embedding_used'] += 1
+            final_results = self._rerank(query, self._merge_and_optimize(all_results, analysis), level)
+            
+            response_time = time.time() - start_time
+            self._record_latency(response_time)
+            
+            print(f"✅ AKIŞLI ARAMA BİTTİ: {len(final_results)} final sonuç, {response_time:.2f}s")
+            yield 'final', final_results
+            
+        except Exception as e:
+            print(f"🚨 AKIŞLI ARAMA HATASI: {str(e)}")
+            yield 'final', []
+        
+        finally:
+            self._end_search()
+    
+    def _search_plan(self, query: str, level: int = 0) -> Tuple[QueryAnalysis, List[Tuple[str, str, float]], Dict]:
+        """Sorgu analizi, ağırlıklı varyantlar ve kategori ön filtresi"""
+        # 1. Sorgu analizi - tek geçiş, expander ile paylaşılır
+        analysis = self.category_detector.analyze(query, fuzzy=level < 2)
+        
+        print(f"📊 ANALİZ: Kategori={analysis.primary_category}, Güven={analysis.confidence:.2f}")
+        print(f"🔍 ÖZELLİKLER: {analysis.features}")
+        
+        # 2. Çoklu genişletme + 3. her genişletilmiş sorgu için embedding araması
+        queries = self._variant_queries(query, analysis, level)
+        
+        print(f"🔄 GENİŞLETME:")
+        for query_type, query_text, _ in queries[1:]:
+            print(f"  {query_type.title()}: {query_text[:50]}...")
+        
+        # Güvenli kategori tespitinde arama alanını daralt
+        where = self._category_filter(analysis)
+        if where:
+            self.search_stats['prefiltered_searches'] += 1
+            print(f"🗂️ ÖN FİLTRE: {where}")
+        
+        return analysis, queries, where
+    
+    def _confident_match(self, original_hits: List[Dict], where: Dict) -> bool:
+        """Orijinal varyantın en iyi isabeti yeterince benzer ve ikinciden belirgin şekilde ayrı mı"""
+        search_config = self.config['search']
+        if where and len({r['id'] for r in original_hits}) < search_config['prefilter_min_results']:
+            return False
+        
+        similarities = sorted((r['base_similarity'] for r in original_hits), reverse=True)
+        if not similarities or similarities[0] < search_config['early_exit_similarity']:
+            return False
+        
+        runner_up = similarities[1] if len(similarities) > 1 else 0.0
+        if similarities[0] - runner_up < search_config['early_exit_margin']:
+            return False
+        
+        self.search_stats['early_exits'] += 1
+        print(f"🏁 ERKEN ÇIKIŞ: benzerlik {similarities[0]:.3f}, fark {similarities[0] - runner_up:.3f}")
+        return True
+    
+    def _shadow_check(self, analysis: QueryAnalysis, queries: List[Tuple[str, str, float]], where: Dict,
+                      original_hits: List[Dict], early_results: List[Dict]):
+        """Örneklenen erken çıkışlarda tam aramayı arka planda çalıştır - top-1 değişti mi"""
+        if not early_results or random.random() >= self.config['search']['early_exit_shadow_rate']:
+            return
+        
+        def shadow():
+            try:
+                all_results = [dict(r) for r in original_hits] + self._retrieve(
+                    queries[1:], analysis.primary_category, where)
+                full_results = self._merge_and_optimize(all_results, analysis)
+            except Exception as e:
+                print(f"🚨 GÖLGE KONTROL HATASI: {str(e)}")
+                return
+            
+            with self._stats_lock:
+                self.search_stats['early_exit_shadow_checks'] += 1
+                if full_results and full_results[0]['id'] != early_results[0]['id']:
+                    self.search_stats['early_exit_shadow_changed'] += 1
+                    print(f"👻 GÖLGE: top-1 değişirdi ({early_results[0]['id']} -> {full_results[0]['id']})")
+        
+        threading.Thread(target=shadow, daemon=True).start()
+    
+    def _prefilter_too_sparse(self, where: Dict, results: List[Dict]) -> bool:
+        """Filtreli arama çok az doküman döndürdüyse global aramaya dönülür"""
+        if where and len({r['id'] for r in results}) < self.config['search']['prefilter_min_results']:
+            print("↩️ FİLTRE SEYREK - global arama")
+            self.search_stats['prefilter_fallbacks'] += 1
+            return True
+        return False
+    
+    def multi_intent_search(self, sub_queries: List[str], level: int = None) -> List[Tuple[str, List[Dict]]]:
+        """Alt sorguları tek batch'te ara - her alt soru için ayrı sonuç listesi"""
+        start_time = time.time()
+        level = self._search_level(level)
+        
+        self.search_stats['total_searches'] += 1
+        self.search_stats['multi_intent_searches'] += 1
+        self._begin_search(level)
+        
+        try:
+            print(f"🧩 ÇOKLU SORU ARAMASI: {len(sub_queries)} alt sorgu")
+            
+            # Her alt sorgu kendi analizi ve varyantlarıyla
+            plans = []
+            queries, categories = [], []
+            for sub_query in sub_queries:
+                analysis = self.category_detector.analyze(sub_query, fuzzy=level < 2)
+                variants = self._variant_queries(sub_query, analysis, level)
+                plans.append((sub_query, analysis, len(queries), len(queries) + len(variants)))
+                queries.extend(variants)
+                categories.extend([analysis.primary_category] * len(variants))
+                print(f"  ❓ '{sub_query[:50]}' -> {analysis.primary_category}")
+            
+            # Tüm alt sorgular x varyantlar: tek encode + tek ChromaDB çağrısı
+            hits = self._batched_search(queries, categories)
+            self.search_stats['multi_embedding_used'] += 1
+            
+            sections = []
+            for sub_query, analysis, begin, end in plans:
+                sub_results = [result for variant_hits in hits[begin:end] for result in variant_hits]
+                sections.append((sub_query, self._merge_and_optimize(sub_results, analysis)))
+            
+            # Tüm alt soruların adayları tek cross-encoder geçişinde
+            sections = list(zip(sub_queries, self._rerank_sections(sections, level)))
+            
+            response_time = time.time() - start_time
+            self._record_latency(response_time)
+            
+            print(f"✅ ÇOKLU SORU ARAMASI BİTTİ: {len(queries)} varyant, 1 sorgu, {response_time:.2f}s")
+            return sections
+            
+        except Exception as e:
+            print(f"🚨 ÇOKLU SORU HATASI: {str(e)}")
+            return [(sub_query, []) for sub_query in sub_queries]
+        
+        finally:
+            self._end_search()
+    
+    def lexical_search(self, query: str) -> List[Dict]:
+        """Sadece BM25 - embedding/ChromaDB çağrısı yok (cache_only seviyesinde cache kaçırması)"""
+        if self.lexical_index is None:
+            return []
+        
+        self._begin_search(len(DEGRADATION_LEVELS) - 1)
+        try:
+            lexical_hits = self.lexical_index.search(query, self.config['search']['max_results'])
+            if not lexical_hits:
+                return []
+            
+            # Normalize BM25 benzerlik yerine - aynı bonus/skor hattı
+            analysis = self.category_detector.analyze(query, fuzzy=False)
+            max_bm25 = lexical_hits[0][1]
+            ids = [doc_id for doc_id, _ in lexical_hits]
+            documents = [self.lexical_index.documents[doc_id][0] for doc_id in ids]
+            metadatas = [self.lexical_index.documents[doc_id][1] for doc_id in ids]
+            distances = [1.0 - score / max_bm25 for _, score in lexical_hits]
+            
+            results = self._process_hits(query, ids, documents, metadatas, distances,
+                                         analysis.primary_category, 1.0)
+            results.sort(key=lambda x: x['skor'], reverse=True)
+            return results
+        
+        finally:
+            self._end_search()
+    
+    def degradation_level(self) -> int:
+        """Eşzamanlı arama sayısı veya son p95 gecikmesine göre bozulma seviyesi (DEGRADATION_LEVELS indeksi)"""
+        search_config = self.config['search']
+        if not search_config.get('degradation_enabled'):
+            return 0
+        
+        level = 0
+        for index, limit in enumerate(search_config['degradation_queue_depth'], 1):
+            if self.load_tracker.in_flight >= limit:
+                level = index
+        
+        p95 = self.latency_p95()
+        for index, limit in enumerate(search_config['degradation_p95'], 1):
+            if p95 >= limit:
+                level = max(level, index)
+        
+        return level
     
-    def _single_search(self, query_text: str, category: str, weight: float) -> List[Dict]:
+    def latency_p95(self) -> float:
+        """Son degradation_window_seconds içindeki aramaların p95 gecikmesi (tüm oturumlar) - az örnekte 0"""
+        search_config = self.config['search']
+        return self.load_tracker.p95(search_config['degradation_window_seconds'],
+                                     search_config['degradation_min_samples'])
+    
+    def _search_level(self, level: int = None) -> int:
+        """Yoğun arama seviyesi - cache_only sadece çağıranın lexical_search kararı, burada en fazla no_fuzzy"""
+        if level is None:
+            level = self.degradation_level()
+        return min(level, len(DEGRADATION_LEVELS) - 2)
+    
+    def _begin_search(self, level: int):
+        """Eşzamanlı arama sayacı ve seviye istatistiği"""
+        self.load_tracker.begin()
+        if level:
+            self.search_stats['degraded_searches'][DEGRADATION_LEVELS[level]] += 1
+            print(f"🪫 YÜK ALTINDA: {DEGRADATION_LEVELS[level]}")
+    
+    def _end_search(self):
+        self.load_tracker.end()
+    
+    def _record_latency(self, response_time: float):
+        """Ortalama süre ve p95 penceresi"""
+        self.search_stats['avg_response_time'] = (
+            self.search_stats['avg_response_time'] + response_time
+        ) / 2
+        self.load_tracker.record(response_time)
+    
+    def _variant_queries(self, query: str, analysis: QueryAnalysis, level: int = 0) -> List[Tuple[str, str, float]]:
+        """Orijinal sorgu + ağırlıklı genişletme varyantları (variant_weights) - yük altında sadece orijinal + smart"""
+        basic_exp, smart_exp, deep_exp = self.word_expander.multi_expand(query, analysis)
+        weights = self.config['search']['variant_weights']
+        if level >= 1:
+            queries = [
+                ("original", query, weights['original']),
+                ("smart", smart_exp, weights['smart'])
+            ]
+        else:
+            queries = [
+                ("original", query, weights['original']),
+                ("basic", basic_exp, weights['basic']),
+                ("smart", smart_exp, weights['smart']),
+                ("deep", deep_exp, weights['deep'])
+            ]
+        
+        # Ağırlığı 0 olan genişletme aranmaz (offline ayarlama ile kapatılabilir)
+        queries = [q for q in queries if q[0] == "original" or q[2] > 0]
+        
+        if self.config['search'].get('variant_pruning'):
+            queries = self._prune_variants(queries)
+        return queries
+    
+    def _prune_variants(self, queries: List[Tuple[str, str, float]]) -> List[Tuple[str, str, float]]:
+        """Yeni terim eklemeyen varyantları at - sonuçlar max ile birleştiği için ağırlık kalan eşine geçer"""
+        kept = []
+        seen_terms = {}
+        for query_type, query_text, weight in queries:
+            terms = frozenset(query_text.lower().split())
+            if terms not in seen_terms:
+                seen_terms[terms] = len(kept)
+                kept.append((query_type, query_text, weight))
+                continue
+            
+            index = seen_terms[terms]
+            kept_type, kept_text, kept_weight = kept[index]
+            kept[index] = (kept_type, kept_text, max(kept_weight, weight))
+            self.search_stats['pruned_variants'] += 1
+            print(f"✂️ VARYANT ATLANDI: {query_type} = {kept_type}")
+        
+        return kept
+    
+    def _prune_similar(self, queries: List[Tuple[str, str, float]], query_vectors) -> Tuple[List, object]:
+        """Embedding'i neredeyse aynı varyantları at (kosinüs >= variant_dedup_similarity)"""
+        threshold = self.config['search'].get('variant_dedup_similarity', 0)
+        if not threshold or len(queries) < 2:
+            return queries, query_vectors
+        
+        norms = np.maximum(np.linalg.norm(query_vectors, axis=1, keepdims=True), 1e-12)
+        similarity = (query_vectors / norms) @ (query_vectors / norms).T
+        
+        kept = []
+        for qi, (query_type, query_text, weight) in enumerate(queries):
+            twin = next((ki for ki in kept if similarity[qi, ki] >= threshold), None)
+            if twin is None:
+                kept.append(qi)
+                continue
+            
+            twin_type, twin_text, twin_weight = queries[twin]
+            queries[twin] = (twin_type, twin_text, max(twin_weight, weight))
+            self.search_stats['pruned_variants'] += 1
+            print(f"✂️ VARYANT ATLANDI: {query_type} ≈ {twin_type} ({similarity[qi, twin]:.3f})")
+        
+        return [queries[ki] for ki in kept], query_vectors[kept]
+    
+    def _batched_search(self, queries: List[Tuple[str, str, float]], categories: List[str]) -> List[List[Dict]]:
+        """Tüm varyantları tek batch'te encode edip tek çağrıda ara - varyant başına sonuç listesi"""
+        texts = [query_text for _, query_text, _ in queries]
+        embeddings = self.model.encode(texts).tolist()
+        
+        results = self.collection.query(
+            query_embeddings=embeddings,
+            n_results=self._n_results(self.config['search']['max_results']),
+            include=["documents", "metadatas", "distances"]
+        )
+        self.search_stats['vector_store_queries'] += 1
+        
+        hits = []
+        for qi, (_, query_text, weight) in enumerate(queries):
+            documents = results['documents'][qi] if results['documents'] else []
+            count = len(documents)
+            hits.append(self._process_hits(
+                query_text,
+                results['ids'][qi],
+                documents,
+                results['metadatas'][qi] if results['metadatas'] else [{}] * count,
+                results['distances'][qi],
+                categories[qi],
+                weight
+            ))
+        
+        return hits
+    
+    def _retrieve(self, queries: List[Tuple[str, str, float]], category: str, where: Dict = None) -> List[Dict]:
+        """Tüm varyantlar için aday getir - ortak havuz veya varyant bazlı"""
+        return self._retrieve_variants(queries, category, where)[0]
+    
+    def _retrieve_variants(self, queries: List[Tuple[str, str, float]], category: str, where: Dict = None,
+                           early_exit: bool = False) -> Tuple[List[Dict], bool]:
+        """Varyant adayları ve erken çıkış yapıldı mı - çıkışta sadece orijinalin isabetleri döner"""
+        # Ortak aday havuzu - tek ChromaDB çağrısı
+        if self.config['search'].get('shared_candidates') and NUMPY_OK:
+            shared_results = self._shared_candidate_search(queries, category, where, early_exit)
+            if shared_results is not None:
+                return shared_results
+        
+        all_results = []
+        for qi, (query_type, query_text, weight) in enumerate(queries):
+            results = self._single_search(query_text, category, weight, where)
+            all_results.extend(results)
+            print(f"  {query_type}: {len(results)} sonuç")
+            
+            # Orijinal güvenli eşleşti - kalan varyantlar için encode/sorgu yapılmaz
+            if early_exit and qi == 0 and self._confident_match(results, where):
+                return all_results, True
+        
+        return all_results, False
+    
+    def _category_filter(self, analysis: QueryAnalysis) -> Dict:
+        """Yüksek güvenli kategori için ChromaDB where filtresi"""
+        search_config = self.config['search']
+        if not search_config.get('category_prefilter') or not analysis.detected_category:
+            return None
+        
+        if analysis.confidence < search_config['prefilter_min_confidence']:
+            return None
+        
+        # Göreli pay tek genel kelimeyle (doz, mg) 1.0 olur - mutlak, özgül kelime skoru gerekir
+        if self._specific_category_score(analysis) < search_config['prefilter_min_score']:
+            return None
+        
+        doc_categories = self.config['category_documents'].get(analysis.detected_category)
+        if not doc_categories:
+            return None
+        
+        if len(doc_categories) == 1:
+            return {'kategori': doc_categories[0]}
+        return {'kategori': {'$in': list(doc_categories)}}
+    
+    def _specific_category_score(self, analysis: QueryAnalysis) -> int:
+        """Tespit edilen kategorinin genel anahtar kelimeler hariç skoru (tam eşleşme 5 + kelime 3)"""
+        generic = set(self.config['search']['prefilter_generic_keywords'])
+        query_lower = analysis.query.lower()
+        score = 0
+        for keyword in self.config['categories'].get(analysis.detected_category, []):
+            if keyword in generic:
+                continue
+            if keyword in query_lower:
+                score += 5
+            if keyword in analysis.words:
+                score += 3
+        return score
+    
+    def _single_search(self, query_text: str, category: str, weight: float, where: Dict = None) -> List[Dict]:
         """Tek arama işlemi"""
         try:
             # Embedding oluştur
@@ -284,100 +887,208 @@ class PowerfulSearchEngine:
             # ChromaDB'de ara
             results = self.collection.query(
                 query_embeddings=[embedding],
-                n_results=self.config['search']['max_results'],
+                n_results=self._n_results(self.config['search']['max_results']),
+                where=where,
                 include=["documents", "metadatas", "distances"]
             )
+            self.search_stats['vector_store_queries'] += 1
             
             # Sonuçları işle
-            processed = []
-            if results['documents'] and results['documents'][0]:
-                for i in range(len(results['documents'][0])):
-                    distance = results['distances'][0][i]
-                    base_similarity = max(0.0, 1.0 - distance)
-                    
-                    # Çoklu bonus sistemi
-                    bonuses = self._calculate_advanced_bonuses(
-                        query_text, 
-                        results['documents'][0][i],
-                        results['metadatas'][0][i] if results['metadatas'] else {},
-                        category
-                    )
-                    
-                    # Final skor
-                    final_score = base_similarity * bonuses['total_bonus'] * weight
-                    
-                    processed.append({
-                        'id': results['ids'][0][i] if results['ids'] else f"result_{i}",
-                        'icerik': results['documents'][0][i],
-                        'skor': final_score,
-                        'base_similarity': base_similarity,
-                        'bonuses': bonuses,
-                        'weight': weight,
-                        'metadata': results['metadatas'][0][i] if results['metadatas'] else {},
-                        'kategori': results['metadatas'][0][i].get('kategori', '') if results['metadatas'] else '',
-                        'guvenilirlik': results['metadatas'][0][i].get('guvenilirlik', 0.8) if results['metadatas'] else 0.8
-                    })
-            
-            return processed
+            if not (results['documents'] and results['documents'][0]):
+                return []
+            
+            count = len(results['documents'][0])
+            return self._process_hits(
+                query_text,
+                results['ids'][0] if results['ids'] else [f"result_{i}" for i in range(count)],
+                results['documents'][0],
+                results['metadatas'][0] if results['metadatas'] else [{}] * count,
+                results['distances'][0],
+                category,
+                weight
+            )
             
         except Exception as e:
             print(f"🚨 TEK ARAMA HATASI: {str(e)}")
             return []
     
+    def _shared_candidate_search(self, queries: List[Tuple[str, str, float]], category: str,
+                                 where: Dict = None, early_exit: bool = False) -> Tuple[List[Dict], bool]:
+        """Tek ChromaDB çağrısı ile aday havuzu - varyantlar lokal skorlanır, (sonuçlar, erken çıkış)"""
+        try:
+            # Tüm varyantlar tek batch'te encode edilir
+            texts = [query_text for _, query_text, _ in queries]
+            query_vectors = np.asarray(self.model.encode(texts), dtype=np.float32)
+            queries, query_vectors = self._prune_similar(list(queries), query_vectors)
+            
+            # Tek round-trip: her varyant için geniş k, doküman embedding'leri dahil
+            results = self.collection.query(
+                query_embeddings=query_vectors.tolist(),
+                n_results=self._n_results(self.config['search']['candidate_pool_size']),
+                where=where,
+                include=["documents", "metadatas", "embeddings"]
+            )
+            self.search_stats['vector_store_queries'] += 1
+            
+            # Aday birleşimi - ID bazında
+            candidates = {}
+            for qi, ids in enumerate(results['ids']):
+                for i, doc_id in enumerate(ids):
+                    if doc_id not in candidates:
+                        metadata = results['metadatas'][qi][i] if results['metadatas'] else {}
+                        candidates[doc_id] = (results['documents'][qi][i], metadata, results['embeddings'][qi][i])
+            
+            if not candidates:
+                return [], False
+            
+            candidate_ids = list(candidates)
+            doc_vectors = np.asarray([candidates[doc_id][2] for doc_id in candidate_ids], dtype=np.float32)
+            distances = self._local_distances(query_vectors, doc_vectors)
+            
+            # Her varyant kendi top-k'sını havuzdan seçer
+            max_results = self._n_results(self.config['search']['max_results'])
+            all_results = []
+            exited = False
+            for qi, (query_type, query_text, weight) in enumerate(queries):
+                order = np.argsort(distances[qi], kind='stable')[:max_results]
+                results_for_variant = self._process_hits(
+                    query_text,
+                    [candidate_ids[j] for j in order],
+                    [candidates[candidate_ids[j]][0] for j in order],
+                    [candidates[candidate_ids[j]][1] for j in order],
+                    [float(distances[qi][j]) for j in order],
+                    category,
+                    weight
+                )
+                all_results.extend(results_for_variant)
+                print(f"  {query_type}: {len(results_for_variant)} sonuç (ortak havuz)")
+                
+                # Orijinalin satırları havuzdan aynen çıkar - güvenli eşleşmede kalan varyantlar skorlanmaz
+                if early_exit and qi == 0 and len(queries) > 1 and self._confident_match(results_for_variant, where):
+                    exited = True
+                    break
+            
+            self.search_stats['shared_candidate_searches'] += 1
+            print(f"  🧺 Ortak havuz: {len(candidate_ids)} aday, 1 sorgu")
+            return all_results, exited
+            
+        except Exception as e:
+            print(f"🚨 ORTAK HAVUZ HATASI: {str(e)} - varyant bazlı aramaya dönülüyor")
+            return None
+    
+    def _local_distances(self, query_vectors, doc_vectors):
+        """Koleksiyonun uzaklık metriğini lokal olarak hesapla (nokta çarpımı ile)"""
+        space = (self.collection.metadata or {}).get('hnsw:space', 'l2')
+        dots = query_vectors @ doc_vectors.T
+        
+        if space == 'ip':
+            return 1.0 - dots
+        
+        if space == 'cosine':
+            norms = np.outer(np.linalg.norm(query_vectors, axis=1), np.linalg.norm(doc_vectors, axis=1))
+            return 1.0 - dots / np.maximum(norms, 1e-12)
+        
+        # l2 (ChromaDB varsayılanı) - kare uzaklık
+        query_sq = (query_vectors * query_vectors).sum(axis=1)[:, None]
+        doc_sq = (doc_vectors * doc_vectors).sum(axis=1)[None, :]
+        return np.maximum(query_sq + doc_sq - 2.0 * dots, 0.0)
+    
+    def _n_results(self, k: int) -> int:
+        """Pasaj modunda aynı dokümanın pasajları için k'yı büyüt"""
+        if self.config['model'].get('passage_window'):
+            return k * self.config['search']['passage_oversample']
+        return k
+    
+    def _process_hits(self, query_text: str, ids: List[str], documents: List[str], metadatas: List[dict],
+                      distances: List[float], category: str, weight: float) -> List[Dict]:
+        """Ham sonuçları skorlanmış sonuç sözlüklerine çevir"""
+        processed = []
+        for i in range(len(documents)):
+            distance = distances[i]
+            base_similarity = max(0.0, 1.0 - distance)
+            metadata = metadatas[i] or {}
+            doc_id, document, passage = ids[i], documents[i], None
+            
+            # Pasaj isabeti - ebeveyn dokümana bağla, bonuslar tam metin üzerinden
+            parent_id = metadata.get('parent_id')
+            if parent_id and self.lexical_index is not None and parent_id in self.lexical_index.documents:
+                passage = {
+                    'id': doc_id,
+                    'text': document,
+                    'step_start': metadata.get('step_start', 0),
+                    'step_end': metadata.get('step_end', 0)
+                }
+                doc_id = parent_id
+                document = self.lexical_index.documents[parent_id][0]
+            
+            # Çoklu bonus sistemi
+            bonuses = self._calculate_advanced_bonuses(
+                query_text, 
+                document,
+                metadata,
+                category
+            )
+            
+            # Final skor
+            final_score = base_similarity * bonuses['total_bonus'] * weight
+            
+            processed.append({
+                'id': doc_id,
+                'icerik': document,
+                'skor': final_score,
+                'base_similarity': base_similarity,
+                'bonuses': bonuses,
+                'weight': weight,
+                'metadata': metadata,
+                'kategori': metadata.get('kategori', ''),
+                'guvenilirlik': metadata.get('guvenilirlik', 0.8),
+                'passage': passage
+            })
+        
+        # Aynı dokümanın pasajları - en iyi pasaj kalır
+        if any(result['passage'] for result in processed):
+            processed = self._collapse_passages(processed)
+        
+        return processed
+    
+    def _collapse_passages(self, processed: List[Dict]) -> List[Dict]:
+        """Pasaj isabetlerini ebeveyn dokümana topla (max-pooling)"""
+        best = {}
+        hits = {}
+        for result in processed:
+            hits[result['id']] = hits.get(result['id'], 0) + 1
+            if result['id'] not in best or result['skor'] > best[result['id']]['skor']:
+                best[result['id']] = result
+        
+        collapsed = sorted(best.values(), key=lambda x: x['skor'], reverse=True)
+        for result in collapsed:
+            result['passage_hits'] = hits[result['id']]
+        
+        return collapsed[:self.config['search']['max_results']]
+    
     def _calculate_advanced_bonuses(self, query: str, document: str, metadata: dict, category: str) -> Dict[str, float]:
-        """Gelişmiş bonus hesaplama sistemi"""
+        """Gelişmiş bonus hesaplama sistemi - çarpanlar SEARCH_CONFIG['bonus_weights']"""
+        weights = self.config['search']['bonus_weights']
+        features = self._bonus_features(query, document, metadata, category)
         bonuses = {}
         
-        # 1. Exact match bonus - geliştirilmiş
-        query_words = set(w.lower() for w in query.split() if len(w) > 2)
-        doc_words = set(w.lower() for w in document.split() if len(w) > 2)
-        
-        if query_words:
-            exact_matches = len(query_words & doc_words)
-            exact_ratio = exact_matches / len(query_words)
-            bonuses['exact_match'] = 1.0 + (exact_ratio * 0.4)  # Max %40 bonus
-        else:
-            bonuses['exact_match'] = 1.0
+        # 1. Exact match bonus - eşleşme oranıyla doğrusal
+        bonuses['exact_match'] = 1.0 + features['exact_ratio'] * weights['exact_match']
         
-        # 2. Kategori bonus - akıllı
-        doc_category = metadata.get('kategori', '')
-        if doc_category == category:
-            bonuses['category_match'] = 1.3  # %30 bonus
-        elif self._are_related_categories(doc_category, category):
-            bonuses['category_match'] = 1.1  # %10 bonus
-        else:
-            bonuses['category_match'] = 1.0
+        # 2. Kategori bonus - aynı / ilişkili
+        bonuses['category_match'] = weights.get(f"category_{features['category']}", 1.0)
         
-        # 3. Güvenilirlik bonus
-        reliability = metadata.get('guvenilirlik', 0.8)
-        bonuses['reliability'] = 0.8 + (reliability * 0.2)  # 0.8-1.0 arası
+        # 3. Güvenilirlik bonus - (1 - w) ile 1.0 arası
+        bonuses['reliability'] = 1.0 - weights['reliability'] + features['reliability'] * weights['reliability']
         
         # 4. Uzunluk bonus - ideal uzunluk
-        doc_length = len(document.split())
-        if 20 <= doc_length <= 150:  # İdeal uzunluk
-            bonuses['length'] = 1.15
-        elif 10 <= doc_length < 20 or 150 < doc_length <= 250:
-            bonuses['length'] = 1.05
-        else:
-            bonuses['length'] = 0.95
+        bonuses['length'] = weights[f"length_{features['length']}"]
         
         # 5. Acillik bonus
-        emergency_level = metadata.get('acillik', 'normal')
-        if emergency_level == 'kritik':
-            bonuses['emergency'] = 1.2
-        elif emergency_level == 'yuksek':
-            bonuses['emergency'] = 1.1
-        else:
-            bonuses['emergency'] = 1.0
+        bonuses['emergency'] = weights.get(f"emergency_{features['emergency']}", 1.0)
         
         # 6. Semantic bonus - özel kelimeler
-        semantic_bonus = 1.0
-        high_value_words = ['epinefrin', 'aed', 'kompresyon', 'defibrilasyon', 'entübasyon']
-        for word in high_value_words:
-            if word in query.lower() and word in document.lower():
-                semantic_bonus += 0.1
-        
-        bonuses['semantic'] = min(semantic_bonus, 1.5)  # Max %50
+        bonuses['semantic'] = min(1.0 + features['semantic_hits'] * weights['semantic_step'], weights['semantic_max'])
         
         # Toplam bonus
         bonuses['total_bonus'] = (
@@ -391,19 +1102,46 @@ class PowerfulSearchEngine:
         
         return bonuses
     
+    def _bonus_features(self, query: str, document: str, metadata: dict, category: str) -> Dict[str, any]:
+        """Bonusların ağırlıktan bağımsız girdileri - offline ayarlama (tune_search.py) da kullanır"""
+        query_words = set(w.lower() for w in query.split() if len(w) > 2)
+        doc_words = set(w.lower() for w in document.split() if len(w) > 2)
+        exact_ratio = len(query_words & doc_words) / len(query_words) if query_words else 0.0
+        
+        doc_category = metadata.get('kategori', '')
+        if doc_category == category:
+            relation = 'same'
+        elif self._are_related_categories(doc_category, category):
+            relation = 'related'
+        else:
+            relation = 'none'
+        
+        doc_length = len(document.split())
+        if 20 <= doc_length <= 150:  # İdeal uzunluk
+            length = 'ideal'
+        elif 10 <= doc_length < 20 or 150 < doc_length <= 250:
+            length = 'near'
+        else:
+            length = 'other'
+        
+        query_lower = query.lower()
+        document_lower = document.lower()
+        semantic_hits = sum(1 for word in HIGH_VALUE_WORDS if word in query_lower and word in document_lower)
+        
+        return {
+            'exact_ratio': exact_ratio,
+            'category': relation,
+            'reliability': metadata.get('guvenilirlik', 0.8),
+            'length': length,
+            'emergency': metadata.get('acillik', 'normal'),
+            'semantic_hits': semantic_hits
+        }
+    
     def _are_related_categories(self, cat1: str, cat2: str) -> bool:
         """İlişkili kategoriler"""
-        relations = {
-            'cpr': ['çocuk', 'acil'],
-            'aed': ['cpr', 'acil'],
-            'ilaç': ['cpr', 'acil'],
-            'çocuk': ['cpr'],
-            'acil': ['cpr', 'aed', 'ilaç']
-        }
-        
-        return cat2 in relations.get(cat1, [])
+        return cat2 in CATEGORY_RELATIONS.get(cat1, ())
     
-    def _merge_and_optimize(self, all_results: List[Dict], analysis: Dict) -> List[Dict]:
+    def _merge_and_optimize(self, all_results: List[Dict], analysis: QueryAnalysis) -> List[Dict]:
         """Sonuçları birleştir ve optimize et"""
         # Duplicate elimination by ID
         seen_ids = set()
@@ -417,17 +1155,128 @@ class PowerfulSearchEngine:
                 seen_ids.add(result['id'])
                 unique_results.append(result)
         
+        # Sözcüksel (BM25) sinyal ile füzyon
+        if self.lexical_index is not None and self.config['search'].get('hybrid_fusion'):
+            unique_results = self._fuse_lexical(unique_results, analysis)
+        
         # En iyi sonuçları al
         final_results = unique_results[:self.config['search']['max_results']]
         
-        # Sonuçları tekrar sırala
-        final_results.sort(key=lambda x: x['skor'], reverse=True)
+        # Sonuçları tekrar sırala (rrf modunda füzyon sırası korunur)
+        if self.config['search'].get('hybrid_fusion') != 'rrf':
+            final_results.sort(key=lambda x: x['skor'], reverse=True)
         
         return final_results
     
+    def _rerank(self, query: str, results: List[Dict], level: int = 0) -> List[Dict]:
+        """Tek sorgunun top-N'ini cross-encoder ile yeniden sırala"""
+        return self._rerank_sections([(query, results)], level)[0]
+    
+    def _rerank_sections(self, sections: List[Tuple[str, List[Dict]]], level: int = 0) -> List[List[Dict]]:
+        """Her bölümün ilk rerank_top_n sonucu cross-encoder skoruna göre - cache'te olmayan çiftler tek batch'te"""
+        if self.reranker is None or not self.config['search'].get('rerank') or level:
+            return [results for _, results in sections]
+        
+        top_n = self.config['search']['rerank_top_n']
+        
+        def pair_key(query, result):
+            # Pasaj isabetinde skorlanan metin pasajdır
+            target = result['passage']['id'] if result.get('passage') else result['id']
+            return ' '.join(query.lower().split()), target
+        
+        scores = {}
+        pending = {}
+        for query, results in sections:
+            for result in results[:top_n]:
+                key = pair_key(query, result)
+                if key in self._rerank_cache:
+                    scores[key] = self._rerank_cache[key]
+                    self.search_stats['rerank_cache_hits'] += 1
+                elif key not in pending:
+                    text = result['passage']['text'] if result.get('passage') else result['icerik']
+                    pending[key] = (query, text)
+        
+        if pending:
+            try:
+                keys = list(pending)
+                predicted = self.reranker.predict([pending[key] for key in keys], batch_size=len(keys),
+                                                  show_progress_bar=False)
+            except Exception as e:
+                print(f"🚨 YENİDEN SIRALAMA HATASI: {str(e)} - bi-encoder sırası korunuyor")
+                return [results for _, results in sections]
+            
+            self.search_stats['rerank_pairs'] += len(keys)
+            for key, score in zip(keys, predicted):
+                scores[key] = float(score)
+                if len(self._rerank_cache) >= self.config['search']['rerank_cache_size']:
+                    self._rerank_cache.pop(next(iter(self._rerank_cache)))
+                self._rerank_cache[key] = float(score)
+        
+        reranked = []
+        for query, results in sections:
+            head = results[:top_n]
+            for result in head:
+                result['rerank_score'] = scores[pair_key(query, result)]
+            head = sorted(head, key=lambda x: x['rerank_score'], reverse=True)
+            reranked.append(head + results[top_n:])
+        
+        self.search_stats['reranked_searches'] += 1
+        print(f"🎯 YENİDEN SIRALAMA: {sum(min(len(r), top_n) for _, r in sections)} aday, {len(pending)} yeni çift")
+        return reranked
+    
+    def _fuse_lexical(self, dense_results: List[Dict], analysis: QueryAnalysis) -> List[Dict]:
+        """BM25 skorlarını dense skorlarla birleştir (ağırlıklı toplam veya RRF)"""
+        search_config = self.config['search']
+        lexical_hits = self.lexical_index.search(analysis.query, search_config['lexical_top_k'])
+        if not lexical_hits:
+            return dense_results
+        
+        self.search_stats['hybrid_fusions'] += 1
+        max_bm25 = lexical_hits[0][1]
+        lexical_norm = {doc_id: score / max_bm25 for doc_id, score in lexical_hits}
+        lexical_rank = {doc_id: rank for rank, (doc_id, _) in enumerate(lexical_hits)}
+        
+        # Sadece sözcüksel eşleşen dokümanlar - dense benzerliği 0
+        results = list(dense_results)
+        dense_ids = {r['id'] for r in dense_results}
+        for doc_id, _ in lexical_hits:
+            if doc_id not in dense_ids:
+                icerik, metadata = self.lexical_index.documents[doc_id]
+                results.extend(self._process_hits(
+                    analysis.query, [doc_id], [icerik], [metadata], [1.0], analysis.primary_category, 1.0
+                ))
+        
+        # Ağırlıklı toplam - BM25 katkısı en iyi dense skoruna ölçeklenir, skor ölçeği korunur
+        top_dense = dense_results[0]['skor'] if dense_results else 1.0
+        lexical_weight = search_config['lexical_weight']
+        for result in results:
+            result['bm25'] = lexical_norm.get(result['id'], 0.0)
+            result['skor'] += lexical_weight * result['bm25'] * top_dense
+        
+        if search_config['hybrid_fusion'] == 'rrf':
+            rrf_k = search_config['rrf_k']
+            dense_rank = {r['id']: rank for rank, r in enumerate(dense_results)}
+            for result in results:
+                rrf = 0.0
+                if result['id'] in dense_rank:
+                    rrf += 1.0 / (rrf_k + dense_rank[result['id']] + 1)
+                if result['id'] in lexical_rank:
+                    rrf += 1.0 / (rrf_k + lexical_rank[result['id']] + 1)
+                result['rrf'] = rrf
+            results.sort(key=lambda x: x['rrf'], reverse=True)
+        else:
+            results.sort(key=lambda x: x['skor'], reverse=True)
+        
+        return results
+    
     def get_search_stats(self) -> Dict:
-        """Arama istatistikleri"""
-        return self.search_stats.copy()
+        """Arama istatistikleri - erken çıkış ve gölge değişim oranları dahil"""
+        stats = self.search_stats.copy()
+        stats['early_exit_rate'] = stats['early_exits'] / max(1, stats['total_searches'])
+        stats['early_exit_shadow_change_rate'] = (
+            stats['early_exit_shadow_changed'] / max(1, stats['early_exit_shadow_checks'])
+        )
+        return stats
 
 # ResponseGenerator aynı kalabilir - sadece import değişikliği
 class ResponseGenerator:
@@ -440,23 +1289,56 @@ class ResponseGenerator:
         
         best_result = results[0]
         
-        response = f"## 🫀 CPR Rehberi v3.0\n\n"
-        response += f"**Sorunuz:** {query}\n\n"
-        response += f"**Kategori:** {best_result['kategori'].replace('_', ' ').title()}\n\n"
-        
-        response += "### 📋 Yapılacaklar:\n\n"
-        steps = self._split_steps(best_result['icerik'])
-        for i, step in enumerate(steps, 1):
-            response += f"**{i}.** {step}\n\n"
+        parts = [
+            f"## 🫀 CPR Rehberi v3.0\n\n",
+            f"**Sorunuz:** {query}\n\n",
+            f"**Kategori:** {best_result['kategori'].replace('_', ' ').title()}\n\n",
+            "### 📋 Yapılacaklar:\n\n",
+            self._render_steps(best_result)
+        ]
         
         güvenilirlik = int(best_result['guvenilirlik'] * 100)
-        response += f"**📊 Güvenilirlik:** %{güvenilirlik}\n"
-        response += f"**🎯 Gelişmiş Skor:** {best_result['skor']:.3f}\n"
+        parts.append(f"**📊 Güvenilirlik:** %{güvenilirlik}\n")
+        parts.append(f"**🎯 Gelişmiş Skor:** {best_result['skor']:.3f}\n")
         
         # Bonus bilgilerini göster
         if 'bonuses' in best_result:
             bonuses = best_result['bonuses']
-            response += f"**🚀 Bonus Detayı:** Exact:{bonuses['exact_match']:.2f}, Kategori:{bonuses['category_match']:.2f}\n"
+            parts.append(f"**🚀 Bonus Detayı:** Exact:{bonuses['exact_match']:.2f}, Kategori:{bonuses['category_match']:.2f}\n")
+        
+        parts.append(f"**🧠 Model:** Gelişmiş Türkçe v3.0\n\n")
+        
+        parts.append("### ⚠️ Hatırlatma\n")
+        parts.append("• **112'yi arayın** acil durumlarda\n")
+        parts.append("• **Bu rehber eğitim amaçlıdır**\n")
+        
+        return "".join(parts)
+    
+    def generate_multi_response(self, query: str, sections: List[Tuple[str, List[Dict]]]) -> str:
+        """Çok parçalı soru - her alt soru için ayrı bölüm"""
+        response = f"## 🫀 CPR Rehberi v3.0\n\n"
+        response += f"**Sorunuz:** {query}\n\n"
+        
+        shown = {}
+        for index, (sub_query, results) in enumerate(sections, 1):
+            response += f"### ❓ {index}. {sub_query}\n\n"
+            
+            if not results:
+                response += "_Bu soru için bilgi bankasında sonuç bulunamadı._\n\n"
+                continue
+            
+            best_result = results[0]
+            response += f"**Kategori:** {best_result['kategori'].replace('_', ' ').title()} "
+            response += f"(Skor: {best_result['skor']:.3f})\n\n"
+            
+            # Aynı protokol tekrar basılmaz - pasaj modunda eşleşen adımlar yeterli
+            repeated = best_result['id'] in shown
+            if repeated and not best_result.get('passage'):
+                response += f"_Yanıt {shown[best_result['id']]}. bölümdeki protokolde._\n\n"
+                continue
+            
+            shown.setdefault(best_result['id'], index)
+            response += self._render_steps(best_result, only_highlighted=repeated)
         
         response += f"**🧠 Model:** Gelişmiş Türkçe v3.0\n\n"
         
@@ -466,24 +1348,24 @@ class ResponseGenerator:
         
         return response
     
+    def _render_steps(self, result: Dict, only_highlighted: bool = False) -> str:
+        """Numaralı adım listesi - pasaj modunda eşleşen adımlar vurgulanır"""
+        steps = self._split_steps(result['icerik'])
+        passage = result.get('passage')
+        highlighted = range(passage['step_start'], passage['step_end']) if passage else range(0)
+        
+        rendered = []
+        for i, step in enumerate(steps, 1):
+            if i - 1 in highlighted:
+                rendered.append(f"**{i}.** 👉 **{step}**\n\n")
+            elif not only_highlighted:
+                rendered.append(f"**{i}.** {step}\n\n")
+        
+        return "".join(rendered)
+    
     def _split_steps(self, content: str) -> List[str]:
         """Adımlara böl"""
-        if not content:
-            return ["İçerik bulunamadı"]
-        
-        if re.search(r'\d+\.', content):
-            steps = re.split(r'\d+\.', content)[1:]
-            clean_steps = [step.strip() for step in steps if step.strip()]
-            if clean_steps:
-                return clean_steps
-        
-        if '. ' in content:
-            steps = content.split('. ')
-            clean_steps = [step.strip() for step in steps if len(step.strip()) > 10]
-            if clean_steps:
-                return clean_steps
-        
-        return [content]
+        return split_steps(content)
     
     def _no_results(self, query: str) -> str:
         """Sonuç yok"""
@@ -0,0 +1,56 @@
+# test_generation_cache.py - Diskteki üretim cache'i testi
+import json
+import os
+import tempfile
+import time
+
+from llm_client import GenerationCache
+
+def kayit_yaz(cache, key, entry):
+    """Cache dosyasını elle yaz - bozuk kayıt senaryoları için"""
+    with open(cache._path(key), 'w', encoding='utf-8') as f:
+        f.write(entry if isinstance(entry, str) else json.dumps(entry))
+
+def test_gecerli_kayit_okunur():
+    with tempfile.TemporaryDirectory() as klasor:
+        cache = GenerationCache(klasor, ttl=60, max_entries=10)
+        cache.put('a', 'yanıt', 'model')
+
+        assert cache.get('a') == 'yanıt'
+        assert cache.stats['hits'] == 1
+
+def test_suresi_dolan_kayit_silinir():
+    with tempfile.TemporaryDirectory() as klasor:
+        cache = GenerationCache(klasor, ttl=60, max_entries=10)
+        kayit_yaz(cache, 'a', {'created': time.time() - 120, 'model': 'model', 'text': 'eski'})
+
+        assert cache.get('a') is None
+        assert cache.stats['expired'] == 1
+        assert not os.path.exists(cache._path('a'))
+
+def test_bozuk_kayit_iska_sayilir():
+    """Yanlış tipli veya eksik alanlı kayıt istisna atmaz - ıska olarak döner"""
+    bozuklar = [
+        {'created': 'dün', 'text': 'yanıt'},
+        {'created': None, 'text': 'yanıt'},
+        {'created': True, 'text': 'yanıt'},
+        {'created': time.time(), 'text': None},
+        {'created': time.time(), 'text': ['yanıt']},
+        {'text': 'yanıt'},
+        ['created', 'text'],
+        '{bozuk json',
+    ]
+    with tempfile.TemporaryDirectory() as klasor:
+        cache = GenerationCache(klasor, ttl=60, max_entries=10)
+        for sira, entry in enumerate(bozuklar):
+            kayit_yaz(cache, f"k{sira}", entry)
+            assert cache.get(f"k{sira}") is None
+
+        assert cache.stats['misses'] == len(bozuklar)
+        assert cache.stats['hits'] == 0
+
+if __name__ == "__main__":
+    for ad, test in list(globals().items()):
+        if ad.startswith('test_'):
+            test()
+            print(f"✅ {ad}")
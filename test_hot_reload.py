@@ -0,0 +1,125 @@
+# test_hot_reload.py - Bilgi bankası yeniden yükleme testi
+# Gerçek model ve disk indeksi yerine sahte embedding + bellek içi ChromaDB kullanılır
+import contextlib
+import io
+import json
+import os
+import tempfile
+import zlib
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+
+import model_core
+from config import get_config
+
+KB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cpr_egitim_bilgi_bankasi.json')
+
+class SahteModel:
+    """Kelime hash'lerinden embedding - ağ ve model indirmesi gerektirmez"""
+
+    dim = 64
+
+    def _tek(self, text):
+        v = np.zeros(self.dim, dtype=np.float32)
+        for kelime in text.lower().split():
+            v[zlib.crc32(kelime.encode()) % self.dim] += 1.0
+        n = np.linalg.norm(v)
+        return v / n if n else v
+
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, str):
+            return self._tek(texts)
+        return np.stack([self._tek(t) for t in texts]) if texts else np.zeros((0, self.dim), np.float32)
+
+class SahteCore(model_core.CPRModelCore):
+    """Bellek içi ChromaDB ve sahte model ile çalışan çekirdek"""
+
+    client = chromadb.EphemeralClient(Settings(anonymized_telemetry=False, allow_reset=True))
+
+    def _init_chromadb(self):
+        self.chroma_client = self.client
+        self.collection = model_core._SHARED_INDEX.open_active(self.client, self.config['model']['collection_name'])
+        return True
+
+    def _load_model(self):
+        self.model = SahteModel()
+        return True
+
+@contextlib.contextmanager
+def sistem(kayitlar):
+    """Geçici bilgi bankasıyla başlatılmış sistem - config sonunda geri alınır"""
+    config = get_config()
+    eski_model = dict(config['model'])
+    eski_arama = dict(config['search'])
+
+    with tempfile.TemporaryDirectory() as klasor:
+        kb = os.path.join(klasor, 'kb.json')
+        with open(kb, 'w', encoding='utf-8') as f:
+            json.dump(kayitlar, f, ensure_ascii=False)
+
+        config['model'].update(knowledge_base=kb, kb_watch_interval=0, strict_validation=False)
+        config['search']['prefetch_enabled'] = False
+        model_core.TRANSFORMERS_OK = True
+        try:
+            core = SahteCore()
+            with contextlib.redirect_stdout(io.StringIO()):
+                assert core.start_system()
+            yield core, kb
+        finally:
+            config['model'].clear()
+            config['model'].update(eski_model)
+            config['search'].clear()
+            config['search'].update(eski_arama)
+            SahteCore.client.reset()
+            model_core._SHARED_INDEX.current = (0, None, None)
+
+def yeniden_yukle(core, kb, kayitlar):
+    """Dosyayı yaz ve senkron yeniden yükle"""
+    with open(kb, 'w', encoding='utf-8') as f:
+        json.dump(kayitlar, f, ensure_ascii=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return core.reload_knowledge_base(background=False)
+
+def test_gecersiz_kayit_onceki_surumuyle_kalir():
+    """Geçersiz hale gelen kaydın son geçerli sürümü yeni nesle kopyalanır"""
+    with open(KB_PATH, encoding='utf-8') as f:
+        kayitlar = json.load(f)
+
+    with sistem(kayitlar) as (core, kb):
+        hedef = kayitlar[3]['id']
+        onceki = core.collection.get(ids=[hedef], include=["documents", "embeddings"])
+
+        kayitlar[3].pop('kategori')
+        assert yeniden_yukle(core, kb, kayitlar)
+
+        sonraki = core.collection.get(ids=[hedef], include=["documents", "embeddings"])
+        assert sonraki['documents'] == onceki['documents']
+        assert np.allclose(sonraki['embeddings'][0], onceki['embeddings'][0])
+        assert core.collection.count() == len(kayitlar)
+        assert hedef in core.search_engine.lexical_index.documents
+        assert core.last_reload['invalid'] == 1
+        assert core.last_reload['kept'] == 1
+        assert core.last_reload['deleted'] == 0
+
+def test_gecerli_kayit_yoksa_mevcut_nesil_kalir():
+    """Tüm kayıtlar geçersizse yeni nesil yayınlanmaz"""
+    with open(KB_PATH, encoding='utf-8') as f:
+        kayitlar = json.load(f)
+
+    with sistem(kayitlar) as (core, kb):
+        aktif = core.collection.name
+        for kayit in kayitlar:
+            kayit.pop('kategori', None)
+
+        assert not yeniden_yukle(core, kb, kayitlar)
+        assert core.collection.name == aktif
+        assert core.collection.count() == len(kayitlar)
+        assert not core.last_reload['success']
+
+if __name__ == "__main__":
+    for ad, test in list(globals().items()):
+        if ad.startswith('test_'):
+            test()
+            print(f"✅ {ad}")
@@ -1,11 +1,8 @@
 # test_ollama_with_translate_v2.py - PARÇALI ÇEVİRİ
-import requests
-import json
-import urllib.parse
-import re
+from llm_client import OllamaClient
+from translator import Translator
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
-TRANSLATE_URL = "https://api.mymemory.translated.net/get"
+OLLAMA_URL = "http://localhost:11434"
 
 # İNGİLİZCE PROMPT - DAHA KISA
 test_question = """
@@ -23,45 +20,32 @@ Short professional response:
 print("🧪 Ollama + Parçalı Çeviri Testi...")
 print("-" * 50)
 
+# Keep-alive havuzlu, akışlı istemci - URL değiştirilerek yerel stub sunucuya da bağlanır
+ollama = OllamaClient(base_url=OLLAMA_URL)
+
 def ask_ollama(prompt, model_name="gemma:2b", timeout=30):
-    """Ollama'dan İngilizce yanıt al"""
-    payload = {
-        "model": model_name,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "temperature": 0.1,
-            "num_predict": 300  # DAHA KISA YANIT
-        }
-    }
+    """Ollama'dan İngilizce yanıt al - token'lar geldikçe yazdırılır"""
+    tokens = []
+    for token in ollama.generate_stream(prompt, model=model_name, timeout=timeout,
+                                        options={"temperature": 0.1, "num_predict": 300}):  # DAHA KISA YANIT
+        print(token, end="", flush=True)
+        tokens.append(token)
+    print()
     
-    try:
-        response = requests.post(OLLAMA_URL, json=payload, timeout=timeout)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"❌ Ollama hatası: {e}")
+    if not tokens:
+        print("❌ Ollama hatası: yanıt alınamadı")
         return None
+    return {"response": "".join(tokens)}
+
+# Cümle sınırında parçalar, eşzamanlı çeviri, disk cache (TRANSLATION_CONFIG)
+translator = Translator()
 
 def translate_to_turkish(text):
-    """İngilizce'den Türkçe'ye çeviri (500 karakter sınırı için parçalı)"""
+    """İngilizce'den Türkçe'ye çeviri - başarısız parçalar orijinal kalır"""
     try:
-        # Metni 500 karakterlik parçalara böl
-        chunks = [text[i:i+400] for i in range(0, len(text), 400)]
-        translated_chunks = []
-        
-        for chunk in chunks:
-            text_encoded = urllib.parse.quote(chunk)
-            response = requests.get(f"{TRANSLATE_URL}?q={text_encoded}&langpair=en|tr", timeout=15)
-            
-            if response.status_code == 200:
-                data = response.json()
-                translated_chunks.append(data['responseData']['translatedText'])
-            else:
-                translated_chunks.append(chunk)  # Çeviri başarısızsa orijinal
-        
-        return " ".join(translated_chunks)
-            
+        turkish = translator.translate(text, "en", "tr")
+        print(f"🌍 Çeviri: {translator.stats}")
+        return turkish
     except Exception as e:
         print(f"❌ Çeviri hatası: {e}")
         return text
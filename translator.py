@@ -0,0 +1,190 @@
+# translator.py - Parçalı çeviri aşaması
+"""Cümle sınırında parçalama, eşzamanlı çeviri, disk cache - değiştirilebilir backend"""
+
+import os
+import re
+import json
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+from config import get_config
+
+# HTTP backend için - yoksa sadece yerel backend kullanılabilir
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    REQUESTS_OK = True
+except ImportError:
+    REQUESTS_OK = False
+
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?:;])\s+')
+
+def split_sentences(line: str, max_chars: int) -> List[str]:
+    """Satırı cümle sınırında max_chars'ı aşmayan parçalara böl - uzun cümle kelime sınırında"""
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_END_RE.split(line.strip()):
+        # Tek başına sığmayan cümle - kelime sınırında böl
+        pieces = [sentence]
+        if len(sentence) > max_chars:
+            pieces = []
+            piece = ""
+            for word in sentence.split():
+                if piece and len(piece) + 1 + len(word) > max_chars:
+                    pieces.append(piece)
+                    piece = word
+                else:
+                    piece = f"{piece} {word}" if piece else word
+            if piece:
+                pieces.append(piece)
+        
+        for piece in pieces:
+            if current and len(current) + 1 + len(piece) > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current} {piece}" if current else piece
+    
+    if current:
+        chunks.append(current)
+    
+    return chunks
+
+class TranslationBackend(ABC):
+    """Backend arayüzü - translate(text, source, target) -> str"""
+    
+    name = 'base'
+    
+    @abstractmethod
+    def translate(self, text: str, source: str, target: str) -> str:
+        """Tek parçayı çevir - hata durumunda istisna fırlatır"""
+
+class EchoBackend(TranslationBackend):
+    """Yerel yedek - metni olduğu gibi döndürür (çevrimdışı test)"""
+    
+    name = 'echo'
+    
+    def translate(self, text: str, source: str, target: str) -> str:
+        return text
+
+class MyMemoryBackend(TranslationBackend):
+    """MyMemory API - keep-alive oturumu ile"""
+    
+    name = 'mymemory'
+    
+    def __init__(self, url: str, timeout: float, pool_size: int):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def translate(self, text: str, source: str, target: str) -> str:
+        response = self.session.get(self.url, params={'q': text, 'langpair': f"{source}|{target}"},
+                                    timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['responseData']['translatedText']
+
+def create_backend(name: str = None) -> TranslationBackend:
+    """Konfigürasyondaki backend"""
+    config = get_config()['translation']
+    name = name or config['backend']
+    
+    if name == 'mymemory' and REQUESTS_OK:
+        return MyMemoryBackend(config['url'], config['timeout'], config['max_workers'])
+    if name == 'mymemory':
+        print("⚠️ requests yok - yerel çeviri backend'i kullanılıyor")
+    
+    return EchoBackend()
+
+class Translator:
+    """Parçalı çeviri - cache'te olmayan parçalar sınırlı thread havuzunda eşzamanlı çevrilir"""
+    
+    def __init__(self, backend: TranslationBackend = None, cache_path: str = None):
+        self.config = get_config()['translation']
+        self.backend = backend or create_backend()
+        self.cache_path = cache_path if cache_path is not None else self.config['cache_path']
+        self.cache = self._load_cache()
+        self._lock = threading.Lock()
+        self.stats = {'chunks': 0, 'cache_hits': 0, 'translated': 0, 'failed': 0}
+    
+    def translate(self, text: str, source: str = None, target: str = None) -> str:
+        """Metni çevir - satır yapısı ve parça sırası korunur"""
+        source = source or self.config['source']
+        target = target or self.config['target']
+        
+        # Satır bazında plan - numaralı listeler ve paragraflar bozulmasın
+        plan = [split_sentences(line, self.config['max_chars']) if line.strip() else []
+                for line in text.split('\n')]
+        chunks = list(dict.fromkeys(chunk for line_chunks in plan for chunk in line_chunks))
+        
+        keys = {chunk: self._cache_key(chunk, source, target) for chunk in chunks}
+        translations = {chunk: self.cache[keys[chunk]] for chunk in chunks if keys[chunk] in self.cache}
+        missing = [chunk for chunk in chunks if chunk not in translations]
+        
+        self.stats['chunks'] += len(chunks)
+        self.stats['cache_hits'] += len(translations)
+        
+        if missing:
+            workers = min(self.config['max_workers'], len(missing))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # map sırayı korur
+                results = list(executor.map(lambda chunk: self._translate_chunk(chunk, source, target), missing))
+            
+            for chunk, translated in zip(missing, results):
+                if translated is None:
+                    translations[chunk] = chunk  # Çeviri başarısızsa orijinal
+                    continue
+                translations[chunk] = translated
+                self.cache[keys[chunk]] = translated
+            
+            self._save_cache()
+        
+        return "\n".join(" ".join(translations[chunk] for chunk in line_chunks) for line_chunks in plan)
+    
+    def _translate_chunk(self, chunk: str, source: str, target: str) -> str:
+        """Tek parça - hata durumunda None"""
+        try:
+            translated = self.backend.translate(chunk, source, target)
+            with self._lock:
+                self.stats['translated'] += 1
+            return translated
+        except Exception as e:
+            with self._lock:
+                self.stats['failed'] += 1
+            print(f"❌ Çeviri hatası: {e}")
+            return None
+    
+    def _cache_key(self, chunk: str, source: str, target: str) -> str:
+        """Backend + dil çifti + parça içeriği hash'i"""
+        raw = f"{self.backend.name}|{source}|{target}|{chunk}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    
+    def _load_cache(self) -> Dict[str, str]:
+        """Disk cache - yoksa/bozuksa boş"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Çeviri cache okunamadı: {e}")
+            return {}
+    
+    def _save_cache(self):
+        """Atomik yazım - yarım dosya kalmasın"""
+        if not self.cache_path:
+            return
+        
+        # Boyut sınırı - en eski kayıtlar düşer
+        overflow = len(self.cache) - self.config['cache_max_entries']
+        for key in list(self.cache)[:max(0, overflow)]:
+            del self.cache[key]
+        
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.cache, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
@@ -0,0 +1,359 @@
+# tune_search.py - Varyant ağırlıkları ve bonus çarpanları için offline ayarlama
+"""Etiketli soruları önbelleğe alınmış adaylar üzerinde yeniden oynatır, ağırlıkları NumPy ile toplu arar
+
+Kullanım:
+    python tune_search.py [deneme_sayisi] [--yaz]
+
+İlk çalıştırmada model ve ChromaDB ile adaylar toplanır (tuning_cache.json), sonraki
+çalıştırmalar sadece NumPy ile saniyeler içinde binlerce konfigürasyonu değerlendirir.
+--yaz verilirse en iyi konfigürasyon search_weights.json'a yazılır ve SEARCH_CONFIG'e yüklenir.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+
+import numpy as np
+
+from config import get_config
+
+VARIANTS = ('original', 'basic', 'smart', 'deep')
+CATEGORY_CODES = {'none': 0, 'related': 1, 'same': 2}
+LENGTH_CODES = {'ideal': 0, 'near': 1, 'other': 2}
+EMERGENCY_CODES = {'kritik': 0, 'yuksek': 1}  # Diğer seviyeler = 2 (çarpan 1.0)
+
+# Arama aralıkları - orijinal varyant da ayarlanır ama kapatılmaz
+VARIANT_RANGE = (0.5, 1.5)
+BONUS_RANGES = {
+    'exact_match': (0.0, 1.0),
+    'category_same': (1.0, 1.6),
+    'category_related': (1.0, 1.6),
+    'reliability': (0.0, 0.4),
+    'length_ideal': (0.9, 1.3),
+    'length_near': (0.9, 1.2),
+    'length_other': (0.8, 1.1),
+    'emergency_kritik': (1.0, 1.4),
+    'emergency_yuksek': (1.0, 1.4),
+    'semantic_step': (0.0, 0.2),
+    'semantic_max': (1.0, 1.8)
+}
+
+def load_labels(path: str) -> list:
+    """[{"soru": ..., "beklenen": [id, ...]}]"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def cache_fingerprint(labels: list) -> str:
+    """Etiketler + bilgi bankası + model + aday ayarları değişirse önbellek geçersiz"""
+    config = get_config()
+    with open(config['model']['knowledge_base'], 'rb') as f:
+        kb_hash = hashlib.sha1(f.read()).hexdigest()
+    search = config['search']
+    raw = json.dumps([labels, kb_hash, config['model']['model_name'], config['model'].get('passage_window'),
+                      search['max_results'], search['lexical_top_k'], search['category_prefilter'],
+                      search['prefilter_min_confidence'], search['prefilter_min_results'],
+                      search['prefilter_min_score'], search['prefilter_generic_keywords']],
+                     sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def load_engine():
+    """Uygulama ile aynı koleksiyon, model ve BM25 indeksi"""
+    from model_core import CPRModelCore
+    from query_engine import PowerfulSearchEngine
+
+    core = CPRModelCore()
+    ready = (core.data_processor.json_yukle() and core.data_processor.validate_data()
+             and core._init_chromadb() and core._load_model() and core._create_database())
+    if not ready:
+        raise SystemExit("❌ Sistem başlatılamadı - aday önbelleği oluşturulamıyor")
+
+    return PowerfulSearchEngine(core.collection, core.model, core.data_processor.bm25_index)
+
+def build_cases(engine, labels: list) -> list:
+    """Her soru için varyant x aday benzerlikleri ve bonus girdileri - ağırlıktan bağımsız"""
+    # Tüm varyantlar eşit ağırlıkla ve budanmadan - ağırlıklar offline uygulanır
+    search = dict(engine.config['search'])
+    search.update(variant_pruning=False, early_exit=False, variant_weights={v: 1.0 for v in VARIANTS})
+    engine.config = dict(engine.config, search=search)
+
+    cases = []
+    for label in labels:
+        question = label['soru']
+        analysis, queries, where = engine._search_plan(question, 0)
+        category = analysis.primary_category
+
+        hits = {query_type: engine._single_search(text, category, 1.0, where) for query_type, text, _ in queries}
+        if engine._prefilter_too_sparse(where, [r for variant_hits in hits.values() for r in variant_hits]):
+            hits = {query_type: engine._single_search(text, category, 1.0, None) for query_type, text, _ in queries}
+
+        texts = {query_type: text for query_type, text, _ in queries}
+        documents = {}
+        for variant_hits in hits.values():
+            for r in variant_hits:
+                documents.setdefault(r['id'], (r['icerik'], r['metadata']))
+
+        # Sözcüksel füzyon adayları - dense sonuçta olmayanlar benzerlik 0 ile eklenir
+        lexical = {}
+        if engine.lexical_index is not None and search.get('hybrid_fusion'):
+            lexical_hits = engine.lexical_index.search(analysis.query, search['lexical_top_k'])
+            if lexical_hits:
+                lexical = {doc_id: score / lexical_hits[0][1] for doc_id, score in lexical_hits}
+                for doc_id in lexical:
+                    documents.setdefault(doc_id, engine.lexical_index.documents[doc_id])
+
+        doc_ids = list(documents)
+        case = {
+            'soru': question,
+            'docs': doc_ids,
+            'relevant': [doc_id in label['beklenen'] for doc_id in doc_ids],
+            'bm25': [lexical.get(doc_id, 0.0) for doc_id in doc_ids],
+            'lexical': [doc_id in lexical for doc_id in doc_ids],
+            'lexical_rank': [list(lexical).index(doc_id) if doc_id in lexical else 0 for doc_id in doc_ids],
+            'sim': [], 'inlist': [], 'position': [], 'exact': [], 'semantic': []
+        }
+
+        for variant in VARIANTS:
+            similarity = {r['id']: r['base_similarity'] for r in hits.get(variant, [])}
+            position = {r['id']: i for i, r in enumerate(hits.get(variant, []))}
+            case['sim'].append([similarity.get(doc_id, 0.0) for doc_id in doc_ids])
+            case['inlist'].append([doc_id in similarity for doc_id in doc_ids])
+            case['position'].append([position.get(doc_id, 0) for doc_id in doc_ids])
+            features = [engine._bonus_features(texts.get(variant, question), *documents[doc_id], category)
+                        for doc_id in doc_ids]
+            case['exact'].append([f['exact_ratio'] for f in features])
+            case['semantic'].append([f['semantic_hits'] for f in features])
+
+        # Dokümana bağlı girdiler varyanttan bağımsız
+        features = [engine._bonus_features(question, *documents[doc_id], category) for doc_id in doc_ids]
+        case['category'] = [CATEGORY_CODES[f['category']] for f in features]
+        case['reliability'] = [f['reliability'] for f in features]
+        case['length'] = [LENGTH_CODES[f['length']] for f in features]
+        case['emergency'] = [EMERGENCY_CODES.get(f['emergency'], 2) for f in features]
+
+        missing = set(label['beklenen']) - set(doc_ids)
+        if missing:
+            print(f"⚠️ '{question[:40]}': beklenen {sorted(missing)} adaylarda yok")
+        cases.append(case)
+
+    return cases
+
+def load_cases(labels: list, cache_path: str) -> list:
+    """Önbellek geçerliyse diskten, değilse model + ChromaDB ile bir kez topla"""
+    fingerprint = cache_fingerprint(labels)
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('fingerprint') == fingerprint:
+            print(f"⚡ Aday önbelleği: {len(cached['cases'])} soru")
+            return cached['cases']
+
+    print("🧠 Adaylar toplanıyor (model + ChromaDB)...")
+    cases = build_cases(load_engine(), labels)
+    if cache_path:
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': fingerprint, 'cases': cases}, f, ensure_ascii=False)
+    return cases
+
+def pack_cases(cases: list) -> dict:
+    """Soruları (Q, V, D) dizilerine doldur - eksik adaylar maskelenir"""
+    q_count = len(cases)
+    d_max = max(len(case['docs']) for case in cases)
+    shape = (q_count, len(VARIANTS), d_max)
+
+    data = {
+        'sim': np.zeros(shape), 'inlist': np.zeros(shape, bool), 'position': np.zeros(shape, int),
+        'exact': np.zeros(shape), 'semantic': np.zeros(shape),
+        'category': np.zeros((q_count, d_max), int), 'reliability': np.zeros((q_count, d_max)),
+        'length': np.zeros((q_count, d_max), int), 'emergency': np.full((q_count, d_max), 2),
+        'bm25': np.zeros((q_count, d_max)), 'lexical': np.zeros((q_count, d_max), bool),
+        'lexical_rank': np.zeros((q_count, d_max), int),
+        'relevant': np.zeros((q_count, d_max), bool)
+    }
+    for qi, case in enumerate(cases):
+        n = len(case['docs'])
+        for key in ('sim', 'inlist', 'position', 'exact', 'semantic'):
+            data[key][qi, :, :n] = case[key]
+        for key in ('category', 'reliability', 'length', 'emergency', 'bm25', 'lexical', 'lexical_rank', 'relevant'):
+            data[key][qi, :n] = case[key]
+
+    return data
+
+def params_from_config(search: dict) -> dict:
+    """SEARCH_CONFIG ağırlıkları -> tek elemanlı parametre dizileri"""
+    variant_weights = search['variant_weights']
+    bonus_weights = search['bonus_weights']
+    params = {'variants': np.array([[variant_weights[v] for v in VARIANTS]], dtype=float)}
+    for key in BONUS_RANGES:
+        params[key] = np.array([bonus_weights[key]], dtype=float)
+    return params
+
+def sample_params(rng, count: int, center: dict = None, scale: float = 1.0) -> dict:
+    """Rastgele konfigürasyonlar - center verilirse onun çevresinde, aralığın scale oranında"""
+    def draw(low, high, middle):
+        if center is None:
+            return rng.uniform(low, high, count)
+        half = (high - low) * 0.5 * scale
+        return np.clip(middle + rng.uniform(-half, half, count), low, high)
+
+    params = {key: draw(low, high, center[key][0] if center else None) for key, (low, high) in BONUS_RANGES.items()}
+    params['variants'] = np.stack([draw(*VARIANT_RANGE, center['variants'][0, i] if center else None)
+                                   for i in range(len(VARIANTS))], axis=1)
+
+    # Bir kısım konfigürasyonda genişletme kapatılır - kapalı olan çevre aramasında kapalı kalır
+    off = rng.random((count, len(VARIANTS) - 1)) < (0.15 if center is None else 0.05)
+    if center is not None:
+        off |= center['variants'][0, 1:] == 0.0
+    params['variants'][:, 1:][off] = 0.0
+
+    # İlişkili kategori ve yüksek acillik üst seviyelerini geçmesin
+    params['category_related'] = np.minimum(params['category_related'], params['category_same'])
+    params['emergency_yuksek'] = np.minimum(params['emergency_yuksek'], params['emergency_kritik'])
+    return params
+
+def evaluate(params: dict, data: dict, max_results: int, lexical_weight: float) -> tuple:
+    """Konfigürasyon başına MRR@max_results ve top-1 isabet - motorun skor formülü, (C, Q, V, D) yayınım"""
+    def p(key, dims):
+        return params[key].reshape((-1,) + (1,) * dims)
+
+    # Dokümana bağlı çarpanlar (C, Q, D)
+    category = data['category'][None]
+    category_mult = np.where(category == 2, p('category_same', 2), np.where(category == 1, p('category_related', 2), 1.0))
+    reliability_mult = 1.0 - p('reliability', 2) + data['reliability'][None] * p('reliability', 2)
+    length_table = np.stack([params['length_ideal'], params['length_near'], params['length_other']], axis=1)
+    emergency_table = np.stack([params['emergency_kritik'], params['emergency_yuksek'],
+                                np.ones_like(params['emergency_kritik'])], axis=1)
+    length_mult = length_table[:, data['length']]
+    emergency_mult = emergency_table[:, data['emergency']]
+    doc_mult = category_mult * reliability_mult * length_mult * emergency_mult
+
+    # Varyanta bağlı çarpanlar (C, Q, V, D)
+    exact_mult = 1.0 + p('exact_match', 3) * data['exact'][None]
+    semantic_mult = np.minimum(1.0 + p('semantic_step', 3) * data['semantic'][None], p('semantic_max', 3))
+    variant_weights = params['variants'][:, None, :, None]
+    dense = data['sim'][None] * exact_mult * semantic_mult * doc_mult[:, :, None, :] * variant_weights
+
+    # Ağırlığı 0 olan varyant aranmaz - adayları da gelmez
+    searched = data['inlist'][None] & (variant_weights > 0)
+    in_dense = searched.any(axis=2)
+    masked = np.where(searched, dense, -np.inf)
+    dense_doc = np.where(in_dense, masked.max(axis=2), 0.0)
+
+    # Eşit skorda motor birleştirme sırasını korur: varyant sırası, sonra varyant içi sıra, en son sözcüksel
+    best_variant = masked.argmax(axis=2)
+    q_count, variant_count, d_max = data['position'].shape
+    position = np.take_along_axis(np.broadcast_to(data['position'][None], masked.shape),
+                                  best_variant[:, :, None, :], axis=2)[:, :, 0, :]
+    order = np.where(in_dense, best_variant * d_max + position, variant_count * d_max + data['lexical_rank'][None])
+
+    # Ağırlıklı BM25 füzyonu - katkı en iyi dense skoruna ölçeklenir
+    top_dense = np.where(in_dense.any(axis=2), dense_doc.max(axis=2), 1.0)
+    scores = dense_doc + lexical_weight * data['bm25'][None] * top_dense[..., None]
+    scores = np.where(in_dense | data['lexical'][None], scores, -np.inf)
+
+    # En iyi ilgili doküman - eşitlikte sırası önde olan
+    relevant = data['relevant'][None]
+    best_relevant = np.where(relevant, scores, -np.inf).max(axis=2)
+    tied = relevant & (scores == best_relevant[..., None])
+    best_order = np.where(tied, order, np.iinfo(order.dtype).max).min(axis=2)
+    ahead = (scores > best_relevant[..., None]) | ((scores == best_relevant[..., None]) & (order < best_order[..., None]))
+    rank = ahead.sum(axis=2) + 1
+    reciprocal = np.where(np.isfinite(best_relevant) & (rank <= max_results), 1.0 / rank, 0.0)
+    return reciprocal.mean(axis=1), (reciprocal == 1.0).mean(axis=1)
+
+def evaluate_batched(params: dict, data: dict, max_results: int, lexical_weight: float, batch_size: int) -> tuple:
+    """Bellek sınırı için konfigürasyonlar parça parça"""
+    count = len(params['variants'])
+    mrr, top1 = [], []
+    for start in range(0, count, batch_size):
+        chunk = {key: value[start:start + batch_size] for key, value in params.items()}
+        chunk_mrr, chunk_top1 = evaluate(chunk, data, max_results, lexical_weight)
+        mrr.append(chunk_mrr)
+        top1.append(chunk_top1)
+    return np.concatenate(mrr), np.concatenate(top1)
+
+def pick(params: dict, index: int) -> dict:
+    return {key: value[index:index + 1].copy() for key, value in params.items()}
+
+def drop_variants(best: dict, best_mrr: float, data: dict, max_results: int, lexical_weight: float,
+                  tolerance: float) -> tuple:
+    """Kapatılınca MRR düşmeyen genişletmeleri sırayla kapat"""
+    for i, variant in enumerate(VARIANTS[1:], 1):
+        if best['variants'][0, i] == 0.0:
+            continue
+        candidate = {key: value.copy() for key, value in best.items()}
+        candidate['variants'][0, i] = 0.0
+        mrr, _ = evaluate(candidate, data, max_results, lexical_weight)
+        print(f"  ✂️ {variant} kapalı: MRR {mrr[0]:.4f} (fark {mrr[0] - best_mrr:+.4f})")
+        if mrr[0] >= best_mrr - tolerance:
+            best, best_mrr = candidate, max(best_mrr, mrr[0])
+    return best, best_mrr
+
+def to_config(params: dict) -> dict:
+    """Parametre dizileri -> SEARCH_CONFIG biçimi"""
+    return {
+        'variant_weights': {v: round(float(params['variants'][0, i]), 4) for i, v in enumerate(VARIANTS)},
+        'bonus_weights': {key: round(float(value[0]), 4) for key, value in params.items() if key != 'variants'}
+    }
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    write = '--yaz' in sys.argv
+
+    config = get_config()
+    tuning = config['tuning']
+    search = config['search']
+    trials = int(args[0]) if args else tuning['trials']
+
+    if search.get('hybrid_fusion') == 'rrf':
+        print("⚠️ RRF füzyonu ayarlanmıyor - değerlendirme ağırlıklı füzyon ile yapılır")
+    lexical_weight = search['lexical_weight'] if search.get('hybrid_fusion') else 0.0
+
+    labels = load_labels(tuning['labels_path'])
+    data = pack_cases(load_cases(labels, tuning['cache_path']))
+    max_results = search['max_results']
+    rng = np.random.default_rng(tuning['seed'])
+
+    start = time.perf_counter()
+    baseline = params_from_config(search)
+    baseline_mrr, baseline_top1 = evaluate(baseline, data, max_results, lexical_weight)
+    best, best_mrr, best_top1 = baseline, baseline_mrr[0], baseline_top1[0]
+
+    # Yarısı geniş rastgele arama, yarısı en iyinin çevresinde daralan arama
+    rounds = [(None, 1.0, trials // 2)] + [('best', scale, trials // 8) for scale in (0.4, 0.2, 0.1, 0.05)]
+    for center, scale, count in rounds:
+        if count <= 0:
+            continue
+        params = sample_params(rng, count, best if center else None, scale)
+        mrr, top1 = evaluate_batched(params, data, max_results, lexical_weight, tuning['batch_size'])
+        # Eşitlikte top-1 isabeti yüksek olan
+        index = int(np.lexsort((-top1, -mrr))[0])
+        if (mrr[index], top1[index]) > (best_mrr, best_top1):
+            best, best_mrr, best_top1 = pick(params, index), mrr[index], top1[index]
+    elapsed = time.perf_counter() - start
+
+    print(f"🧪 {trials} konfigürasyon, {data['relevant'].shape[0]} soru: {elapsed:.2f}s")
+    print(f"📏 Mevcut: MRR {baseline_mrr[0]:.4f}, top-1 {baseline_top1[0]:.2%}")
+    print(f"🏆 En iyi: MRR {best_mrr:.4f}, top-1 {best_top1:.2%}")
+
+    best, best_mrr = drop_variants(best, best_mrr, data, max_results, lexical_weight, tuning['drop_tolerance'])
+    result = to_config(best)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+    if not write:
+        print("ℹ️ Yazmak için: python tune_search.py --yaz")
+        return
+    if result == to_config(baseline):
+        print("ℹ️ Mevcut ağırlıklardan iyisi bulunamadı - yazılmadı")
+        return
+
+    result['tuning'] = {'mrr': round(float(best_mrr), 4), 'baseline_mrr': round(float(baseline_mrr[0]), 4),
+                        'questions': int(data['relevant'].shape[0]), 'trials': trials,
+                        'date': time.strftime('%Y-%m-%d %H:%M')}
+    with open(tuning['output_path'], 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"💾 {tuning['output_path']} yazıldı - SEARCH_CONFIG bir sonraki başlatmada bunu kullanır")
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,15 @@ from typing import List, Dict  # List import eklendi
 from config import get_config
 from model_core import CPRModelCore
 
+# Dedektör kategorisi -> canlı analiz etiketi
+CATEGORY_LABELS = {
+    'ilaç': "İlaç Protokolü",
+    'aed': "AED Kullanımı",
+    'çocuk': "Pediatrik CPR",
+    'hava_yolu': "Hava Yolu",
+    'cpr': "Genel CPR"
+}
+
 class CPRUserInterface:
     """CPR kullanıcı arayüzü - import düzeltildi"""
     
@@ -57,31 +66,14 @@ class CPRUserInterface:
             # Hızlı sorular - kategorilere ayrılmış
             st.markdown("### ⚡ Hızlı Sorular")
             
-            categories = {
-                "🫀 CPR": [
-                    "CPR kompresyon oranı nedir?",
-                    "Kalp masajı derinliği kaç cm?",
-                    "30:2 oranı ne demek?"
-                ],
-                "⚡ AED": [
-                    "AED nasıl kullanılır?",
-                    "AED elektrot yerleşimi",
-                    "AED güvenlik önlemleri"
-                ],
-                "💊 İlaçlar": [
-                    "Epinefrin dozu kaç mg?",
-                    "Amiodarone ne zaman verilir?",
-                    "Atropin endikasyonları"
-                ],
-                "👶 Çocuk": [
-                    "Çocuklarda CPR farkları",
-                    "Bebek kalp masajı",
-                    "Pediatrik dozlar"
-                ]
-            }
+            categories = self.config['quick_questions']
             
             selected_cat = st.selectbox("Kategori:", list(categories.keys()))
             
+            # Seçili kategorinin soruları tıklanmadan önce hesaplansın
+            if st.session_state.get('system_ready'):
+                st.session_state.cpr_system.prefetch(categories[selected_cat])
+            
             for soru in categories[selected_cat]:
                 if st.button(soru, key=f"cat_{soru}", use_container_width=True):
                     st.session_state.selected_question = soru
@@ -105,6 +97,20 @@ class CPRUserInterface:
             if st.button("🗑️ Cache Temizle", use_container_width=True):
                 if 'cpr_system' in st.session_state:
                     st.session_state.cpr_system.clear_cache()
+            
+            if st.button("🔄 Bilgi Bankasını Yenile", use_container_width=True):
+                if st.session_state.get('cpr_system') and st.session_state.cpr_system.reload_knowledge_base():
+                    st.info("⏳ Yeni indeks arka planda kuruluyor...")
+                else:
+                    st.warning("⚠️ Yenileme başlatılamadı")
+            
+            if st.session_state.get('cpr_system') and st.session_state.cpr_system.last_reload:
+                last_reload = st.session_state.cpr_system.last_reload
+                if last_reload['success']:
+                    st.caption(f"🔄 Son yenileme: {last_reload['time'][:19]} "
+                               f"({last_reload['upserted']} güncellendi, {last_reload['deleted']} silindi)")
+                else:
+                    st.caption(f"❌ Son yenileme hatası: {last_reload['error']}")
     
     def _render_main(self):
         """Ana arayüz"""
@@ -165,20 +171,18 @@ class CPRUserInterface:
             st.warning("⚠️ Lütfen bir soru yazın.")
     
     def _show_live_analysis(self, question: str):
-        """Gerçek zamanlı analiz"""
+        """Gerçek zamanlı analiz - motorun dedektörü, normalize metin değişmedikçe memo'dan"""
+        analysis = st.session_state.cpr_system.live_analysis(question)
+        if not analysis:
+            return
+        
         with st.expander("🔍 Canlı Analiz", expanded=False):
             col1, col2 = st.columns(2)
             
             with col1:
-                # Kategori tahmini
-                if any(word in question.lower() for word in ['epinefrin', 'ilaç', 'doz', 'mg']):
-                    st.info("🏷️ Kategori: İlaç Protokolü")
-                elif any(word in question.lower() for word in ['aed', 'defibrillatör', 'şok']):
-                    st.info("🏷️ Kategori: AED Kullanımı")
-                elif any(word in question.lower() for word in ['çocuk', 'bebek', 'pediatrik']):
-                    st.info("🏷️ Kategori: Pediatrik CPR")
-                else:
-                    st.info("🏷️ Kategori: Genel CPR")
+                # Kategori tahmini - arama ile aynı sonuç
+                label = CATEGORY_LABELS.get(analysis['detected_category'], "Genel CPR")
+                st.info(f"🏷️ Kategori: {label} (güven: {analysis['confidence']:.2f})")
             
             with col2:
                 # Sorgu kalitesi
@@ -189,6 +193,12 @@ class CPRUserInterface:
                     st.warning("⚡ Orta detay - İyi")
                 else:
                     st.error("📝 Kısa soru - Detay ekleyin")
+            
+            # Olası dokümanlar - sözcüksel indeksten
+            if analysis['documents']:
+                st.caption("📄 Olası dokümanlar: " + ", ".join(
+                    f"{doc['id']} ({doc['kategori'].replace('_', ' ')})" for doc in analysis['documents']
+                ))
     
     def _init_system(self):
         """Sistem başlat"""
@@ -218,12 +228,61 @@ class CPRUserInterface:
     
     def _handle_search(self, question: str):
         """Arama işlemi - skor düzeltmesi"""
-        with st.spinner("🇹🇷 Türkçe model analiz ediyor..."):
-            result = st.session_state.cpr_system.query(question)
-        
         st.markdown("---")
+        status_area = st.empty()
+        response_area = st.empty()
+        
+        if self.config['search'].get('streaming_results'):
+            # İlk sonuç hemen gösterilir, sıralama arka planda iyileşir
+            status_area.info("🇹🇷 Türkçe model analiz ediyor...")
+            for result in st.session_state.cpr_system.query_stream(question):
+                if result.get('stage') == 'preliminary':
+                    status_area.info("⚡ **İlk sonuç** - sıralama iyileştiriliyor...")
+                    response_area.markdown(result['response'])
+        else:
+            with st.spinner("🇹🇷 Türkçe model analiz ediyor..."):
+                result = st.session_state.cpr_system.query(question)
+        
+        with status_area.container():
+            self._show_status(result)
+        
+        # Ana yanıt
+        response_area.markdown(result['response'])
+        
+        # Üretken yanıt - retrieval yanıtının ardından token token
+        if result.get('refinement_id'):
+            self._show_refinement(result['refinement_id'])
+        elif st.session_state.cpr_system.llm_available(result):
+            st.markdown("### 🤖 Model Yanıtı")
+            st.write_stream(st.session_state.cpr_system.generate_stream(question, result))
+        
+        # Detaylar
+        if st.checkbox("📊 Detayları Göster"):
+            self._show_details(result, question)
         
-        # Sonuç durumu - DÜZELTME
+        # Feedback
+        self._show_feedback(question, result)
+    
+    def _show_refinement(self, refinement_id: str):
+        """Spekülatif mod - arka plan üretimini aynı alana yoklayarak yaz"""
+        st.markdown("### 🤖 Model Yanıtı")
+        refinement_area = st.empty()
+        llm_config = self.config['llm']
+        deadline = time.time() + llm_config['max_duration'] + llm_config['queue_timeout']
+        
+        state = st.session_state.cpr_system.refinement(refinement_id)
+        while state['status'] == 'running' and time.time() < deadline:
+            refinement_area.markdown((state['text'] or "⏳ Model yanıtı hazırlanıyor...") + " ▌")
+            time.sleep(llm_config['refine_poll_interval'])
+            state = st.session_state.cpr_system.refinement(refinement_id)
+        
+        if state['text']:
+            refinement_area.markdown(state['text'])
+        else:
+            refinement_area.caption("⚠️ Model yanıtı alınamadı - yukarıdaki protokol geçerlidir.")
+    
+    def _show_status(self, result: Dict):
+        """Sonuç durumu - skor düzeltmesi"""
         if result['success']:
             if result.get('cache_hit'):
                 st.info("⚡ **Cache Hit!** Hızlı yanıt.")
@@ -241,16 +300,6 @@ class CPRUserInterface:
                     st.warning("⚡ **Orta eşleşme!** Sonuç var ama düşük skor.")
         else:
             st.warning("⚠️ **Spesifik protokol bulunamadı.** Öneriler sunuluyor.")
-        
-        # Ana yanıt
-        st.markdown(result['response'])
-        
-        # Detaylar
-        if st.checkbox("📊 Detayları Göster"):
-            self._show_details(result, question)
-        
-        # Feedback
-        self._show_feedback(question, result)
     
     # config.py - eşik düzeltmesi
     SEARCH_CONFIG = {